@@ -0,0 +1,86 @@
+"""
+Measures how many rows per second ModelList renders, to compare versions.
+
+The objects are built in memory (no database), so only the rendering of the
+rows is measured. Run it from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/modellist_rows.py [rows] [repeat]
+
+It prints the best of 'repeat' runs for a list with the default templates and
+for one with customized tr_template and td_template.
+"""
+
+import sys, time, decimal, datetime
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            INSTALLED_APPS=('django.contrib.contenttypes', 'django.contrib.auth',
+                'django.contrib.sites', 'djangoplus'),
+            SITE_ID=1,
+            STATIC_URL='/static/',
+            )
+
+from django.db import models
+
+from djangoplus.model_info import ModelList
+
+class Item(models.Model):
+    name = models.CharField(max_length=50)
+    description = models.TextField(blank=True)
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+    quantity = models.IntegerField()
+    created = models.DateField()
+    active = models.BooleanField()
+
+    class Meta:
+        app_label = 'benchmarks'
+
+    def get_absolute_url(self):
+        return '/items/%d/'%self.pk
+
+class ItemList(ModelList):
+    class Meta:
+        model = Item
+        fields = ('name', 'description', 'price', 'quantity', 'created', 'active')
+
+class CustomItemList(ModelList):
+    class Meta:
+        model = Item
+        fields = ('name', 'description', 'price', 'quantity', 'created', 'active')
+        tr_template = '<tr class="item">%s</tr>'
+        td_template = '<td class="item-%(field_name)s">%(value)s</td>'
+
+def make_objects(count):
+    today = datetime.date.today()
+
+    return [Item(pk=i+1, name='Item %d'%i, description='Line one\nLine two',
+        price=decimal.Decimal('%d.%02d'%(i * 7, i % 100)), quantity=i % 50,
+        created=today - datetime.timedelta(days=i % 365), active=bool(i % 2))
+        for i in range(count)]
+
+def measure(list_class, objects, repeat):
+    best = None
+
+    for i in range(repeat):
+        started = time.time()
+        list_class(objects).as_string()
+        elapsed = time.time() - started
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return len(objects) / best
+
+def main(args):
+    count = len(args) > 0 and int(args[0]) or 10000
+    repeat = len(args) > 1 and int(args[1]) or 5
+    objects = make_objects(count)
+
+    for list_class in (ItemList, CustomItemList):
+        print '%-16s %10.0f rows/sec'%(list_class.__name__, measure(list_class, objects, repeat))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,91 @@
+"""
+Measures how many values per second are formatted as money, comparing the
+former moneyformat (locale.setlocale and locale.format for each value, then
+split1000 for a thousands separator) with NumberFormat. Run it from the root
+of the repository:
+
+    PYTHONPATH=. python benchmarks/moneyformat.py [values] [repeat]
+
+It prints the best of 'repeat' runs, with no thousands separator and with
+THOUSANDS_SEPARATOR '.'.
+"""
+
+import sys, time, decimal, locale
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+            INSTALLED_APPS=('django.contrib.contenttypes', 'django.contrib.auth',
+                'django.contrib.sites', 'djangoplus'),
+            SITE_ID=1,
+            )
+
+from djangoplus.utils import split1000
+from djangoplus.utils.numberformat import get_number_format
+from djangoplus.templatetags.djangoplus_tags import moneyformat
+from djangoplus import app_settings
+
+def old_moneyformat(value, decimal_places=2, thousands_separator=''):
+    """moneyformat as it was before NumberFormat"""
+    decimal_places = decimal_places is None and 2 or decimal_places
+    thousands_separator = thousands_separator or app_settings.THOUSANDS_SEPARATOR
+
+    if app_settings.MONETARY_LOCALE:
+        locale.setlocale(locale.LC_NUMERIC, app_settings.MONETARY_LOCALE)
+
+    format = r"%0.0"+str(decimal_places)+'f'
+
+    value = value or 0.0
+
+    ret = locale.format(format, float(value), grouping=True)
+
+    if thousands_separator:
+        dec_sep = thousands_separator == ',' and '.' or ','
+        parts = ret.split(dec_sep)
+        ret = split1000(parts[0].replace(thousands_separator, ''), thousands_separator)
+
+        if len(parts) > 1:
+            ret += dec_sep + parts[1]
+
+    return ret
+
+def make_values(count):
+    return [decimal.Decimal('%d.%02d'%((i * 7919) % 10000000 - 5000000, i % 100))
+            for i in range(count)]
+
+def measure(function, values, repeat):
+    best = None
+
+    for i in range(repeat):
+        started = time.time()
+        function(values)
+        elapsed = time.time() - started
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return len(values) / best
+
+def main(args):
+    count = len(args) > 0 and int(args[0]) or 50000
+    repeat = len(args) > 1 and int(args[1]) or 5
+    values = make_values(count)
+
+    for separator in ('', '.'):
+        number_format = get_number_format(app_settings.MONETARY_LOCALE, separator)
+
+        functions = (
+            ('old moneyformat', lambda values: [old_moneyformat(v, 2, separator) for v in values]),
+            ('moneyformat', lambda values: [moneyformat(v, 2, separator) for v in values]),
+            ('NumberFormat.format', lambda values: [number_format.format(v, 2) for v in values]),
+            ('format_many', lambda values: number_format.format_many(values, 2)),
+            )
+
+        print 'Thousands separator: %r'%separator
+
+        for name, function in functions:
+            print '  %-20s %10.0f values/sec'%(name, measure(function, values, repeat))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -12,5 +12,9 @@ __version__ = get_version()
 def get_dynamic_template(slug, context=None):
     from models import DynamicTemplate
 
-    return DynamicTemplate.objects.get(slug=slug).render(context or {})
+    templates = DynamicTemplate.objects.get_templates('slug', slug)
+    if not templates:
+        raise DynamicTemplate.DoesNotExist('There is no dynamic template with slug "%s"'%slug)
+
+    return templates[0].render(context or {})
 
@@ -5,6 +5,20 @@ MONETARY_LOCALE = getattr(settings, 'MONETARY_LOCALE', '')
 THOUSANDS_SEPARATOR = getattr(settings, 'THOUSANDS_SEPARATOR', '')
 STATIC_FILES_PATH = getattr(settings, 'STATIC_FILES_PATH', 'uploads')
 
+DYNAMIC_TEMPLATE_CACHE_SIZE = getattr(settings, 'DYNAMIC_TEMPLATE_CACHE_SIZE', 200)
+DYNAMIC_TEMPLATE_VERSION_CHECK_INTERVAL = getattr(settings, 'DYNAMIC_TEMPLATE_VERSION_CHECK_INTERVAL', 10)
+
+TRANSLATIONS_PRELOAD = getattr(settings, 'TRANSLATIONS_PRELOAD', False)
+TRANSLATIONS_VERSION_CHECK_INTERVAL = getattr(settings, 'TRANSLATIONS_VERSION_CHECK_INTERVAL', 10)
+TRANSLATIONS_LOCAL_CACHE_SIZE = getattr(settings, 'TRANSLATIONS_LOCAL_CACHE_SIZE', 5000)
+TRANSLATIONS_LOCAL_CACHE_TIMEOUT = getattr(settings, 'TRANSLATIONS_LOCAL_CACHE_TIMEOUT', 60)
+
+# Models whose changes invalidate ModelList row caches ("app_label.ModelName").
+# Lists declaring 'row_cache' register their models when they are imported, so
+# this is required to invalidate them from processes that never import the
+# lists (i.e. the admin, cron jobs or workers).
+ROW_CACHE_MODELS = getattr(settings, 'ROW_CACHE_MODELS', ())
+
 ROBOT_PROTECTION_DOMAIN = getattr(settings, 'ROBOT_PROTECTION_DOMAIN', None)
 
 RESULT_OK = getattr(settings, 'RESULT_OK', 'ok')
@@ -6,10 +6,58 @@ except:
     from sets import Set as set
 
 from django.forms.forms import BoundField
-from django.db import models
+from django.db import models, transaction, connections
 from django.utils.safestring import mark_safe
 from django import forms
 
+from djangoplus.utils.bulk import bulk_update
+
+try: # Django 1.6+
+    atomic = transaction.atomic
+except AttributeError:
+    atomic = transaction.commit_on_success
+
+try:
+    from django.utils.datastructures import SortedDict as FieldsDict
+except ImportError: # Django 1.9+
+    from collections import OrderedDict as FieldsDict
+
+UPDATE_BATCH_SIZE = 500
+
+PIVOT_AGGREGATES = {
+    'sum': 'SUM',
+    'count': 'COUNT',
+    'avg': 'AVG',
+    'min': 'MIN',
+    'max': 'MAX',
+    }
+
+PIVOT_MAX_Y_VALUES = 200
+
+LAZY_FIELD = object()
+
+class LazyFieldsDict(FieldsDict):
+    """Dictionary of form fields where some fields are created only on their
+    first access. Their keys are stored with LAZY_FIELD as value and the
+    'factory' function is called with the key to create them."""
+
+    factory = None
+
+    def __getitem__(self, key):
+        value = super(LazyFieldsDict, self).__getitem__(key)
+
+        if value is LAZY_FIELD:
+            value = self.factory(key)
+            super(LazyFieldsDict, self).__setitem__(key, value)
+
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 class CrossTableForm(forms.Form):
     """Customized form class to be extended and used to let users inform
     fields in a cross reference table matrix.
@@ -29,10 +77,19 @@ class CrossTableForm(forms.Form):
         x_field = None
         y_field = None
         cross_fields_template = 'col-%s-%s-'
+        sparse = False
+        x_per_page = None
 
     x_values = None
     y_values = None
     queryset = None
+    cross_field_names = None
+    cross_fields_index = None
+    x_page = 1
+    x_per_page = None
+    x_count = 0
+    sparse = False
+    _cross_objects = None
 
     def __init__(self, *args, **kwargs):
         # Meta class
@@ -46,16 +103,27 @@ class CrossTableForm(forms.Form):
         self.x_values = kwargs.pop('x_values', [])
         self.y_values = kwargs.pop('y_values', [])
 
+        # Pagination of X values
+        self.x_page = kwargs.pop('x_page', 1)
+        self.x_per_page = kwargs.pop('x_per_page', self._meta.x_per_page)
+        self.x_count = len(self.x_values)
+
+        if self.x_per_page:
+            self.x_values = list(self.x_values)[
+                    (self.x_page - 1) * self.x_per_page:self.x_page * self.x_per_page]
+
+        self.sparse = kwargs.pop('sparse', self._meta.sparse)
+
         # Queryset to base on
         self.queryset = kwargs.pop('queryset', None)
 
+        super(CrossTableForm, self).__init__(*args, **kwargs)
+
         # Create cross fields
         self.create_fields()
 
-        super(CrossTableForm, self).__init__(*args, **kwargs)
-
         # Loads initial values from queryset
-        if self.queryset:
+        if self.queryset is not None:
             self.load_initial_from_queryset(self.queryset)
 
     def init_meta(self):
@@ -63,7 +131,8 @@ class CrossTableForm(forms.Form):
         self._meta = self.Meta()
         _meta = self._Meta()
 
-        for attr in ('model','x_model','y_model','x_field','y_field','cross_fields_template',):
+        for attr in ('model','x_model','y_model','x_field','y_field','cross_fields_template',
+                'sparse','x_per_page',):
             if not hasattr(self._meta, attr):
                 setattr(self._meta, attr, getattr(_meta, attr))
 
@@ -81,15 +150,64 @@ class CrossTableForm(forms.Form):
             if isinstance(getattr(self.CrossFields, k), forms.Field)]
 
     def create_fields(self):
-        """Create fields for Y values"""
+        """Registers the cross fields for X and Y values. They are indexed by
+        (x, y, name) in 'cross_field_names' and created only on their first
+        access in 'fields'.
+
+        In sparse mode, only active cells (see 'is_cross_field_active') are
+        fields of the form, so only them are validated and saved."""
+        fields = LazyFieldsDict()
+        fields.factory = self.make_cross_field
+
+        for name, field in self.fields.items():
+            fields[name] = field
+
+        self.cross_field_names = {}
+        self.cross_fields_index = {}
+
         for x_value in self.x_values:
+            x_ref = self.get_x_value(x_value)
+
             for y_value in self.y_values:
+                y_ref = self.get_y_value(y_value)
+                field_prefix = self._meta.cross_fields_template%(x_ref, y_ref)
+
                 for name, field in self.cross_fields:
-                    field_prefix = self._meta.cross_fields_template%(
-                            self.get_x_value(x_value),
-                            self.get_y_value(y_value),
-                            )
-                    self.base_fields[field_prefix + name] = copy.deepcopy(field)
+                    field_name = field_prefix + name
+                    self.cross_field_names[(x_ref, y_ref, name)] = field_name
+                    self.cross_fields_index[field_name] = field
+
+                    if not self.sparse or self.is_cross_field_active(x_ref, y_ref, field_name):
+                        fields[field_name] = LAZY_FIELD
+
+        self.fields = fields
+
+    def is_cross_field_active(self, x_ref, y_ref, field_name):
+        """Used in sparse mode to find if a cross field must be in the form. For
+        bound forms, these are the fields whose widgets find a value in data,
+        so a payload with only the changed cells can be posted (widgets that
+        always have a value, as checkboxes, are always active). For unbound
+        forms, these are the crosses that already have an object in the
+        queryset."""
+        if self.is_bound:
+            widget = self.cross_fields_index[field_name].widget
+            return widget.value_from_datadict(self.data, self.files, self.add_prefix(field_name)) is not None
+
+        return (x_ref, y_ref) in self.get_loaded_cross_objects()
+
+    def get_loaded_cross_objects(self):
+        """Returns the cross objects from the form queryset, loaded only once"""
+        if self._cross_objects is None:
+            if self.queryset is None:
+                self._cross_objects = {}
+            else:
+                self._cross_objects = self.get_cross_objects(self.queryset)
+
+        return self._cross_objects
+
+    def make_cross_field(self, field_name):
+        """Creates a cross field from its prototype in CrossFields"""
+        return copy.deepcopy(self.cross_fields_index[field_name])
 
     def get_x_value(self, value):
         """This method is to get a valid referene (and unique) value from a field
@@ -134,18 +252,23 @@ class CrossTableForm(forms.Form):
                 tds.append(u'<td>%s</td>'%unicode(field))
 
             # Cross fields
+            x_ref = self.get_x_value(x_value)
+
             for y_value in self.y_values:
-                field_prefix = self._meta.cross_fields_template%(
-                        self.get_x_value(x_value),
-                        self.get_y_value(y_value),
-                        )
+                y_ref = self.get_y_value(y_value)
+
+                for name, field in self.cross_fields:
+                    field_name = self.cross_field_names[(x_ref, y_ref, name)]
+                    errors = '' # TODO
 
-                for field_name, field in self.fields.items():
-                    if field_name.startswith(field_prefix):
-                        errors = '' # TODO
-                        bfield = BoundField(self, field, field_name)
+                    if field_name in self.fields:
+                        bfield = unicode(BoundField(self, self.fields[field_name], field_name))
+                    else:
+                        # Inactive cells in sparse mode are just widgets with their initial values
+                        bfield = field.widget.render(self.add_prefix(field_name),
+                                self.initial.get(field_name, None))
 
-                        tds.append(u'<td>%s %s</td>'%(errors, unicode(bfield)))
+                    tds.append(u'<td>%s %s</td>'%(errors, bfield))
 
             tds = u''.join(tds)
 
@@ -164,6 +287,14 @@ class CrossTableForm(forms.Form):
     def __unicode__(self):
         return self.as_table()
 
+    def get_x_num_pages(self):
+        """Returns the number of pages of X values"""
+        if not self.x_per_page:
+            return 1
+
+        return max((self.x_count + self.x_per_page - 1) / self.x_per_page, 1)
+    x_num_pages = property(get_x_num_pages)
+
     def get_cross_object(self, queryset, x_value, y_value):
         """Find object for the cross between X and Y relationship"""
 
@@ -177,6 +308,35 @@ class CrossTableForm(forms.Form):
         except queryset.model.DoesNotExist:
             return None
 
+    def get_cross_objects(self, queryset):
+        """Returns a dictionary with the objects for all crosses between X and Y
+        values, found by only one query and keyed by the tuple of references
+        returned by 'get_x_value' and 'get_y_value'"""
+
+        filters = {}
+        if self.x_values:
+            filters['%s__in'%self._meta.x_field] = list(self.x_values)
+        if self.y_values:
+            filters['%s__in'%self._meta.y_field] = list(self.y_values)
+
+        queryset = queryset.filter(**filters)
+
+        related = [f for f in (self._meta.x_field, self._meta.y_field)
+                if not is_plain_field(queryset.model, f)]
+        if related:
+            queryset = queryset.select_related(*related)
+
+        ret = {}
+
+        for obj in queryset:
+            key = (
+                self.get_x_value(getattr(obj, self._meta.x_field)),
+                self.get_y_value(getattr(obj, self._meta.y_field)),
+                )
+            ret.setdefault(key, obj)
+
+        return ret
+
     def get_field_value_from_queryset(self, queryset, x_value, y_value, name, field):
         """Used be initials loader from queryset method to get the value for just a
         field crossed by X and Y values"""
@@ -189,14 +349,24 @@ class CrossTableForm(forms.Form):
         """Loads intial values from queryset, using meta defined fields and their
         values to find the cross fields values"""
 
-        # Loads initials for cross fields
+        # Loads initials for cross fields, with all objects got by only one query
+        if queryset is self.queryset:
+            objects = self.get_loaded_cross_objects()
+        else:
+            objects = self.get_cross_objects(queryset)
+
         for x_value in self.x_values:
             for y_value in self.y_values:
-                field_prefix = self._meta.cross_fields_template%(x_value, y_value)
-                fields = [f for f in self.cross_fields if f[0].startswith(field_prefix)]
+                key = (self.get_x_value(x_value), self.get_y_value(y_value))
+                obj = objects.get(key, None)
 
-                for name, field in fields:
-                    field.initial = self.get_field_value_from_queryset(queryset, x_value, y_value, name, field)
+                if obj is None:
+                    continue
+
+                field_prefix = self._meta.cross_fields_template%key
+
+                for name, field in self.cross_fields:
+                    self.initial[field_prefix + name] = getattr(obj, name)
 
         # Loads initials for info fields TODO
 
@@ -241,11 +411,61 @@ class CrossTableForm(forms.Form):
 
         obj.save()
 
+    @atomic
     def save(self):
-        """Saves all values to the database"""
+        """Saves all values to the database, within a transaction.
+
+        Existing objects are found by only one query and only the crosses with
+        changed values are written: new objects are created together (with
+        bulk_create, when available) and existing ones are updated together
+        by an UPDATE ... CASE query for each UPDATE_BATCH_SIZE objects (see
+        'bulk_update'), so their save() methods and signals are not called."""
+        queryset = self.queryset
+        if queryset is None:
+            queryset = self._meta.model._default_manager.all()
+            objects = self.get_cross_objects(queryset)
+        else:
+            objects = self.get_loaded_cross_objects()
+
+        new_objects = []
+        updates = []
+
         for x_value in self.x_values:
             for y_value in self.y_values:
-                self.save_cross(x_value, y_value)
+                key = (self.get_x_value(x_value), self.get_y_value(y_value))
+
+                # Only fields in the form are saved (see sparse mode)
+                values = {}
+                for name, field in self.cross_fields:
+                    field_name = self.cross_field_names[key + (name,)]
+                    if field_name in self.cleaned_data:
+                        values[name] = self.cleaned_data[field_name]
+
+                if not values:
+                    continue
+
+                obj = objects.get(key, None)
+
+                # New objects are created only when they have some value
+                if obj is None:
+                    if [v for v in values.values() if v not in (None, '')]:
+                        new_objects.append(self.create_cross_object(queryset, x_value, y_value, values))
+                    continue
+
+                changed = dict([(k, v) for k, v in values.items() if getattr(obj, k) != v])
+                if changed:
+                    updates.append((obj.pk, changed))
+
+        manager = queryset.model._default_manager
+
+        if new_objects:
+            if hasattr(manager, 'bulk_create'):
+                manager.bulk_create(new_objects)
+            else:
+                for obj in new_objects:
+                    obj.save()
+
+        bulk_update(queryset.model, updates, using=queryset.db, batch_size=UPDATE_BATCH_SIZE)
 
 class CrossTableManager(models.Manager):
     """Manager to add support to cross table functions with 3 fields from a model
@@ -257,51 +477,251 @@ class CrossTableManager(models.Manager):
     def get_query_set(self):
         return CrossTableQuerySet(self.model)
 
-    def crosstable(self, x_field, y_field, cross_fields, x_values=None, y_values=None):
+    def crosstable(self, x_field, y_field, cross_fields, x_values=None, y_values=None,
+            compact=False):
         return self.get_query_set().crosstable(x_field, y_field, cross_fields, x_values,
-                y_values)
+                y_values, compact)
+
+    def pivot(self, x_field, y_field, cross_fields, aggregate='sum', x_values=None,
+            y_values=None, compact=False, max_y_values=PIVOT_MAX_Y_VALUES):
+        return self.get_query_set().pivot(x_field, y_field, cross_fields, aggregate,
+                x_values, y_values, compact, max_y_values)
 
 class CrossTableQuerySet(models.query.QuerySet):
     """QuerySet class to add support to cross table functions with 3 fields from a
     model class. This should be used together with CrossTableManager"""
 
-    def crosstable(self, x_field, y_field, cross_fields, x_values=None, y_values=None):
-        """Returns a matrix with crosstable"""
-        qs = self
+    def crosstable(self, x_field, y_field, cross_fields, x_values=None, y_values=None,
+            compact=False):
+        """Returns a matrix with crosstable.
 
-        # Gets X values
-        x_values = x_values or set([getattr(obj, x_field) for obj in qs])
-        x_values = [i for i in x_values]
+        The queryset is read only once and its values are pivoted into a
+        dictionary by (x, y), so the cost is proportional to the number of rows.
 
-        # Gets Y values
-        y_values = y_values or set([getattr(obj, y_field) for obj in qs])
-        y_values = [i for i in y_values]
+        If 'compact' is True, it returns a tuple (x_values, y_values, values)
+        instead, where 'values' is a flat list in row-major order: the value for
+        x_values[i] and y_values[j] is values[i * len(y_values) + j]."""
 
         # Make easier use of cross fields attribute
         cross_fields = isinstance(cross_fields, (list,tuple)) and cross_fields or [cross_fields]
 
+        cells = {}
+        found_x_values, found_y_values = [], []
+        seen_x_values, seen_y_values = set(), set()
+
+        for x_value, y_value, values in self.iter_cross_values(x_field, y_field, cross_fields):
+            if x_value not in seen_x_values:
+                seen_x_values.add(x_value)
+                found_x_values.append(x_value)
+
+            if y_value not in seen_y_values:
+                seen_y_values.add(y_value)
+                found_y_values.append(y_value)
+
+            # The first object found for a cross is the one used
+            if (x_value, y_value) not in cells:
+                cells[(x_value, y_value)] = len(values) > 1 and list(values) or values[0]
+
+        x_values = [i for i in (x_values or found_x_values)]
+        y_values = [i for i in (y_values or found_y_values)]
+
+        if compact:
+            return x_values, y_values, [cells.get((x_value, y_value), None)
+                    for x_value in x_values for y_value in y_values]
+
         ret = [[None] + y_values]
 
-        def get_attr_value(obj, attr):
-            value = getattr(obj, attr)
+        for x_value in x_values:
+            ret.append([x_value] + [cells.get((x_value, y_value), None) for y_value in y_values])
 
-            if callable(value):
-                return value()
+        return ret
 
-            return value
+    def pivot(self, x_field, y_field, cross_fields, aggregate='sum', x_values=None,
+            y_values=None, compact=False, max_y_values=PIVOT_MAX_Y_VALUES):
+        """Returns a matrix like 'crosstable' does, but computed by the database
+        with a single query of conditional aggregations (a column with
+        'AGGREGATE(CASE WHEN y = ... THEN value END)' for each Y value and cross
+        field), so only one row for each X value comes back.
 
-        # Values getter
-        def get_xy_value(x_value, y_value):
-            for obj in qs:
-                if getattr(obj, x_field) == x_value and get_attr_value(obj, y_field) == y_value:
-                    ret = [get_attr_value(obj, field) for field in cross_fields]
-                    ret = len(ret) > 1 and ret or ret[0]
-                    return ret
+        'aggregate' is one of 'sum', 'count', 'avg', 'min' or 'max', or a
+        dictionary with one of them for each cross field. X, Y and cross fields
+        must be model fields; X and Y values of relations are primary keys.
 
-            return None
+        If Y values are not informed, they are found by a distinct query and
+        must be at most 'max_y_values'.
+
+        The query runs on the database of the queryset. Sliced and distinct
+        querysets can't be pivoted, as their rows can't be grouped by X values
+        with the same meaning."""
+
+        if not self.query.can_filter():
+            raise ValueError('A sliced queryset can not be pivoted')
+
+        if self.query.distinct:
+            raise ValueError('A distinct queryset can not be pivoted')
+
+        cross_fields = isinstance(cross_fields, (list,tuple)) and cross_fields or [cross_fields]
+
+        if not isinstance(aggregate, dict):
+            aggregate = dict([(field, aggregate) for field in cross_fields])
+
+        for field in cross_fields:
+            if aggregate.get(field, None) not in PIVOT_AGGREGATES:
+                raise ValueError('Unknown aggregate %r for the cross field "%s". Use one of: %s'%(
+                    aggregate.get(field, None), field, ', '.join(sorted(PIVOT_AGGREGATES.keys()))))
+
+        qs = self.order_by()
+        if x_values:
+            qs = qs.filter(**{'%s__in'%x_field: list(x_values)})
+
+        # Y values must be known to make the columns
+        if y_values:
+            y_values = [getattr(value, 'pk', value) for value in y_values]
+        else:
+            y_values = list(qs.values_list(y_field, flat=True).distinct().order_by(y_field)[:max_y_values+1])
+
+            if len(y_values) > max_y_values:
+                raise ValueError('There are more than %d Y values to pivot'%max_y_values)
+
+        opts = self.model._meta
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        x_column = qn(opts.get_field(x_field).column)
+        y_column = qn(opts.get_field(y_field).column)
+
+        selects, params = [], []
+        for y_value in y_values:
+            for field in cross_fields:
+                selects.append('%s(CASE WHEN %s = %%s THEN %s END)'%(
+                    PIVOT_AGGREGATES[aggregate[field]],
+                    y_column,
+                    qn(opts.get_field(field).column),
+                    ))
+                params.append(y_value)
+
+        sql = 'SELECT %s%s FROM %s'%(x_column, ''.join([', ' + s for s in selects]), qn(opts.db_table))
+
+        # Filters are applied by a subquery with the primary keys
+        if qs.query.where.children:
+            sub_sql, sub_params = qs.values_list('pk').query.get_compiler(qs.db).as_sql()
+            sql += ' WHERE %s IN (%s)'%(qn(opts.pk.column), sub_sql)
+            params.extend(sub_params)
+
+        sql += ' GROUP BY %s ORDER BY %s'%(x_column, x_column)
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+
+        cells = {}
+        found_x_values = []
+        fields_count = len(cross_fields)
+
+        for row in cursor.fetchall():
+            found_x_values.append(row[0])
+
+            for j, y_value in enumerate(y_values):
+                values = row[1 + j * fields_count:1 + (j + 1) * fields_count]
+                cells[(row[0], y_value)] = fields_count > 1 and list(values) or values[0]
+
+        x_values = [getattr(value, 'pk', value) for value in (x_values or found_x_values)]
+
+        if compact:
+            return x_values, y_values, [cells.get((x_value, y_value), None)
+                    for x_value in x_values for y_value in y_values]
+
+        ret = [[None] + y_values]
 
         for x_value in x_values:
-            ret.append([x_value] + [get_xy_value(x_value, y_value) for y_value in y_values])
+            ret.append([x_value] + [cells.get((x_value, y_value), None) for y_value in y_values])
 
         return ret
 
+    def iter_cross_values(self, x_field, y_field, cross_fields):
+        """Iterates over tuples (x value, y value, cross values) for all objects.
+        When all fields are plain model fields or relations (no methods or
+        properties) the values come from a single values_list() query, with no
+        model instances but those of the relations, found by one in_bulk()
+        query for each relation."""
+        fields = [x_field, y_field] + list(cross_fields)
+        relations = dict([(f, get_relation_field(self.model, f)) for f in fields])
+        relations = dict([(f, field) for f, field in relations.items() if field is not None])
+
+        if [f for f in fields if f not in relations and not is_plain_field(self.model, f)]:
+            def get_attr_value(obj, attr):
+                value = getattr(obj, attr)
+
+                if callable(value):
+                    return value()
+
+                return value
+
+            qs = self
+            if relations:
+                qs = qs.select_related(*relations.keys())
+
+            for obj in qs.iterator():
+                yield (getattr(obj, x_field), get_attr_value(obj, y_field),
+                        [get_attr_value(obj, field) for field in cross_fields])
+            return
+
+        columns = [f in relations and relations[f].attname or f for f in fields]
+
+        if not relations:
+            for row in self.values_list(*columns).iterator():
+                yield row[0], row[1], row[2:]
+            return
+
+        # Relations are replaced by their objects, loaded together
+        rows = list(self.values_list(*columns))
+        objects = {}
+
+        for i, f in enumerate(fields):
+            if f in relations:
+                ids = set([row[i] for row in rows if row[i] is not None])
+                objects[i] = in_bulk(relations[f].rel.to, ids)
+
+        for row in rows:
+            row = list(row)
+
+            for i, found in objects.items():
+                if row[i] is not None:
+                    row[i] = found.get(row[i], None)
+
+            yield row[0], row[1], row[2:]
+
+def is_plain_field(model, name):
+    """Returns True if the name is a model field with no relation"""
+    try:
+        field = model._meta.get_field(name)
+    except models.fields.FieldDoesNotExist:
+        return False
+
+    return not getattr(field, 'rel', None)
+
+def get_relation_field(model, name):
+    """Returns the model field with the name if it is a ForeignKey or a
+    OneToOneField to the primary key of another model, or None"""
+    try:
+        field = model._meta.get_field(name)
+    except models.fields.FieldDoesNotExist:
+        return None
+
+    rel = getattr(field, 'rel', None)
+    if rel is None or isinstance(rel, models.ManyToManyRel):
+        return None
+
+    if rel.get_related_field() is not rel.to._meta.pk:
+        return None
+
+    return field
+
+def in_bulk(model, ids):
+    """Returns a dictionary with the objects of the model for the primary keys,
+    loaded UPDATE_BATCH_SIZE at once"""
+    ids = list(ids)
+    ret = {}
+
+    for i in range(0, len(ids), UPDATE_BATCH_SIZE):
+        ret.update(model._default_manager.in_bulk(ids[i:i+UPDATE_BATCH_SIZE]))
+
+    return ret
@@ -69,10 +69,7 @@ class tcp(dict):
     def dynamic_template(self, slug, is_group=False, **context):
         ret = ''
 
-        if self.is_group:
-            templates = DynamicTemplate.objects.filter(group=self.slug)
-        else:
-            templates = DynamicTemplate.objects.filter(slug=self.slug)
+        templates = DynamicTemplate.objects.get_templates(is_group and 'group' or 'slug', slug)
 
         for tpl in templates:
             ret += tpl.render(context)
@@ -0,0 +1,53 @@
+import sys
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+
+from djangoplus.translation_io import iter_translation_rows, export_csv, export_po
+
+class Command(BaseCommand):
+    help = 'Exports translated fields to a CSV or PO file'
+
+    option_list = BaseCommand.option_list + (
+            make_option('--format',
+                default='csv',
+                dest='format',
+                help='csv or po',
+                ),
+            make_option('--language',
+                default=None,
+                dest='languages',
+                action='append',
+                help='Language to export (required once for PO files)',
+                ),
+            make_option('--model',
+                default=None,
+                dest='models',
+                action='append',
+                help='Model to export, as app_label.model',
+                ),
+            make_option('--output',
+                default=None,
+                dest='output',
+                help='Output file (standard output by default)',
+                ),
+            )
+
+    def handle(self, format='csv', languages=None, models=None, output=None, **kwargs):
+        if format not in ('csv', 'po'):
+            raise CommandError('Unknown format "%s"'%format)
+
+        if format == 'po' and (not languages or len(languages) != 1):
+            raise CommandError('PO files must have only one language')
+
+        rows = iter_translation_rows(languages, models)
+        out = output and open(output, 'wb') or sys.stdout
+
+        try:
+            if format == 'po':
+                export_po(out, rows, languages[0])
+            else:
+                export_csv(out, rows)
+        finally:
+            if output:
+                out.close()
@@ -0,0 +1,47 @@
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+
+from djangoplus.translation_io import import_csv, import_po, IMPORT_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Imports translated fields from CSV or PO files'
+    args = '<file file ...>'
+
+    option_list = BaseCommand.option_list + (
+            make_option('--format',
+                default=None,
+                dest='format',
+                help='csv or po (from the file extension by default)',
+                ),
+            make_option('--language',
+                default=None,
+                dest='language',
+                help='Language of PO files with no "Language" header',
+                ),
+            make_option('--batch-size',
+                default=IMPORT_BATCH_SIZE,
+                dest='batch_size',
+                type='int',
+                ),
+            )
+
+    def handle(self, *files, **kwargs):
+        if not files:
+            raise CommandError('You must inform at least one file')
+
+        for path in files:
+            format = kwargs.get('format') or path.rsplit('.', 1)[-1].lower()
+
+            f = open(path, 'rb')
+            try:
+                if format == 'po':
+                    created, updated = import_po(f, kwargs.get('language'), kwargs['batch_size'])
+                elif format == 'csv':
+                    created, updated = import_csv(f, kwargs['batch_size'])
+                else:
+                    raise CommandError('Unknown format "%s"'%format)
+            finally:
+                f.close()
+
+            print '%s: %d created, %d updated'%(path, created, updated)
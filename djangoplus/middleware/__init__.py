@@ -70,4 +70,3 @@ class ProtectAntiRobotsMiddleware(object):
                     ret.set_cookie('protectantirobots_referer_'+str(path), request.META.get('HTTP_REFERER', ''), domain=current_domain)
 
             return ret
-
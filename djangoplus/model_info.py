@@ -1,13 +1,26 @@
-import types, re, decimal
+import types, re, decimal, base64, csv
+from cStringIO import StringIO
+from xml.sax.saxutils import escape as xml_escape
 from datetime import date, time, datetime
 
 from django.utils.safestring import mark_safe
 from django.db import models
-from django.template.defaultfilters import yesno, linebreaksbr, urlize
+from django.template.defaultfilters import yesno, linebreaksbr, urlize, slugify
 from django.utils.text import capfirst
 from django.utils import dateformat
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, FieldError, ImproperlyConfigured, ValidationError
+from django.db import connections
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+from django.utils.translation import get_language
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+try: # Django 1.5+
+    from django.http import StreamingHttpResponse
+except ImportError: # Django 1.5- streams iterators given to HttpResponse
+    from django.http import HttpResponse as StreamingHttpResponse
 
 localize = None
 try: # Django 1.4+
@@ -39,7 +52,79 @@ if not localize:
         return value
 
 from djangoplus.templatetags.djangoplus_tags import moneyformat
+from djangoplus.models import get_row_cache_model_version, register_row_cache_model
 from djangoplus import app_settings
+from djangoplus.utils import get_attr_value
+
+class FieldPlan(object):
+    """Resolved information about a single column of a ModelInfo/ModelList class:
+    the model field, the customized getter and display methods, the choices and
+    the function used to format its values.
+
+    It is built the first time the column is used and cached on the class (see
+    ModelInfoBase.get_field_plan), so rendering rows doesn't need to scan model
+    fields or look for 'get_FIELD_value' methods again."""
+
+    name = None
+    field = None
+    value_method = None
+    display_method = None
+    export_method = None
+    choices = None
+    formatter = None
+
+    def __init__(self, model_info, f_name):
+        self.name = f_name
+        attr_name = f_name.replace('.', '__')
+
+        model = model_info._meta.model
+        if model is not None:
+            for f in model._meta.fields:
+                if f.name == f_name:
+                    self.field = f
+                    break
+
+        if hasattr(model_info, 'get_%s_value'%attr_name):
+            self.value_method = 'get_%s_value'%attr_name
+
+        if hasattr(model_info, 'get_%s_display'%attr_name):
+            self.display_method = 'get_%s_display'%attr_name
+
+        if hasattr(model_info, 'get_%s_export'%attr_name):
+            self.export_method = 'get_%s_export'%attr_name
+
+        if self.field and self.field.choices:
+            self.choices = dict(self.field.choices)
+            self.formatter = self.format_choice
+        elif isinstance(self.field, models.BooleanField):
+            self.formatter = self.format_boolean
+        elif isinstance(self.field, models.TextField):
+            self.formatter = self.format_text
+        else:
+            self.formatter = self.format_value
+
+    def format_choice(self, model_info, f_value):
+        return self.choices.get(f_value, None)
+
+    def format_boolean(self, model_info, f_value):
+        return yesno(f_value)
+
+    def format_text(self, model_info, f_value):
+        if f_value:
+            if model_info._meta.auto_urlize: f_value = urlize(f_value)
+            if model_info._meta.auto_linebreaks: f_value = linebreaksbr(f_value)
+
+        return f_value or ''
+
+    def format_value(self, model_info, f_value):
+        if f_value:
+            if isinstance(f_value, (datetime, time, date, decimal.Decimal)):
+                return localize(f_value)
+
+            if isinstance(f_value, models.Manager):
+                return ', '.join(map(unicode, f_value.all()))
+
+        return f_value or ''
 
 class ModelInfoBase(object):
     class _Meta:
@@ -55,44 +140,77 @@ class ModelInfoBase(object):
     request = None
 
     def get_model_fields(self):
-        ret = [f.name for f in self._meta.model._meta.fields \
-                if f.name != 'id' and \
-                (f.name in self._meta.fields or \
-                not f.name in self._meta.exclude)\
-                ]
+        cls = self.__class__
+        ret = cls.__dict__.get('_model_fields', None)
+
+        if ret is None:
+            ret = [f.name for f in self._meta.model._meta.fields \
+                    if f.name != 'id' and \
+                    (f.name in self._meta.fields or \
+                    not f.name in self._meta.exclude)\
+                    ]
+            cls._model_fields = ret
+
         return ret
 
-    def get_field(self, f_name):
+    def get_field_plan(self, f_name):
+        """Returns the FieldPlan for the informed field. Plans are built once and
+        kept on the class, so every instance of the same ModelInfo/ModelList
+        class shares them."""
+        cls = self.__class__
+        plans = cls.__dict__.get('_field_plans', None)
+
+        if plans is None:
+            plans = cls._field_plans = {}
+
         try:
-            return [f for f in self._meta.model._meta.fields if f.name == f_name][0]
-        except IndexError, e:
-            return None
+            return plans[f_name]
+        except KeyError:
+            plan = plans[f_name] = FieldPlan(self, f_name)
+            return plan
+
+    def get_fields_plan(self, fields=None):
+        """Returns a list of FieldPlan objects for the informed fields (or for
+        the default ones if they are not informed)"""
+        if fields is not None:
+            return [self.get_field_plan(f_name) for f_name in fields]
+
+        cls = self.__class__
+        ret = cls.__dict__.get('_default_fields_plan', None)
+
+        if ret is None:
+            fields = self._meta.fields or self.get_model_fields()
+            ret = cls._default_fields_plan = [self.get_field_plan(f_name) for f_name in fields]
+
+        return ret
+
+    def get_field(self, f_name):
+        return self.get_field_plan(f_name).field
 
     def get_field_display_text(self, f_name):
         """Returns the display text for the informed field. This allows you
         declare a method like 'get_FIELD_display' to returns a customized
         display text."""
+        plan = self.get_field_plan(f_name)
 
-        if hasattr(self, 'get_%s_display'%f_name):
-            ret = getattr(self, 'get_%s_display'%(f_name.replace('.', '__')))()
+        if plan.display_method:
+            ret = getattr(self, plan.display_method)()
+        elif plan.field:
+            ret = plan.field.verbose_name
         else:
-            f = self.get_field(f_name)
-
-            if f:
-                ret = f.verbose_name
-            else:
-                ret = f_name
+            ret = f_name
 
         return ret[0] == ret[0].lower() and ret.capitalize() or ret
 
     def get_field_display_value(self, f_name, instance):
-        field = self.get_field(f_name)
+        plan = self.get_field_plan(f_name)
         f_value = None
 
-        try:
-            return getattr(self, 'get_%s_value'%(f_name.replace('.', '__')))(instance)
-        except AttributeError, e:
-            pass
+        if plan.value_method:
+            try:
+                return getattr(self, plan.value_method)(instance)
+            except AttributeError, e:
+                pass
 
         try:
             f_value = get_attr_value(instance, f_name)
@@ -108,34 +226,9 @@ class ModelInfoBase(object):
             else:
                 return unicode(f_value)
 
-        if field:
-            if field.choices:
-                return dict(field.choices).get(f_value, None)
-
-            if isinstance(field, models.BooleanField):
-                return yesno(f_value)
-
-        if f_value:
-            if isinstance(f_value, (datetime, time, date, decimal.Decimal)):
-                return localize(f_value)
-
-            if isinstance(f_value, models.Manager):
-                return ', '.join(map(unicode, f_value.all()))
-
-            if field and isinstance(field, models.TextField):
-                if self._meta.auto_urlize: f_value = urlize(f_value)
-                if self._meta.auto_linebreaks: f_value = linebreaksbr(f_value)
-
-        return f_value or ''
+        return plan.formatter(self, f_value)
 
     def get_linkable_field_value(self, instance, f_name, f_value, force=False):
-        url = ''
-
-        if isinstance(instance, models.Model) and hasattr(instance, 'get_absolute_url'):
-            url = instance.get_absolute_url()
-        elif type(instance) == types.DictType and instance.has_key('get_absolute_url'):
-            url = instance['get_absolute_url']
-
         if hasattr(instance, 'get_absolute_url') and ( force or f_name in self._meta.list_display_links ):
             return '<a href="%s">%s</a>' %(instance.get_absolute_url(), f_value)
 
@@ -183,7 +276,8 @@ class ModelInfo(ModelInfoBase):
             else:
                 ret.append(self._meta.fieldset_title_template % s_name)
                 
-        for f_name in s_fields:
+        for plan in self.get_fields_plan(s_fields):
+            f_name = plan.name
             f_display = self.get_field_display_text(f_name)
 
             f_value = self.get_field_display_value(f_name)
@@ -231,8 +325,67 @@ class ModelListItem(object):
         return self._row_str
     row_str = property(get_row_str)
 
+SUMMARY_AGGREGATES = {
+    'sum': models.Sum,
+    'avg': models.Avg,
+    'count': models.Count,
+    'min': models.Min,
+    'max': models.Max,
+    }
+
+class SummaryTotal(object):
+    """Computes a summary function for a column in Python, while the rows are
+    read. It follows the same rules as the respective SQL aggregate, ignoring
+    None values."""
+    function = None
+    count = 0
+    value = None
+
+    def __init__(self, function):
+        self.function = function
+
+    def add(self, value):
+        if value is None:
+            return
+
+        self.count += 1
+
+        if self.value is None:
+            self.value = value
+        elif self.function in ('sum', 'avg'):
+            self.value += value
+        elif self.function == 'min':
+            self.value = min(self.value, value)
+        elif self.function == 'max':
+            self.value = max(self.value, value)
+
+    def get_value(self):
+        if self.function == 'count':
+            return self.count
+
+        if self.function == 'avg' and self.count:
+            if isinstance(self.value, decimal.Decimal):
+                return self.value / self.count
+            return float(self.value) / self.count
+
+        return self.value
+
+class ModelListMetaclass(type):
+    """Registers the model of list classes declaring 'row_cache' in their Meta
+    class, so its changes invalidate the cached rows (see
+    'register_row_cache_model')"""
+    def __new__(cls, name, bases, attrs):
+        new_class = super(ModelListMetaclass, cls).__new__(cls, name, bases, attrs)
+        meta = getattr(new_class, 'Meta', None)
+
+        if getattr(meta, 'row_cache', False) and getattr(meta, 'model', None) is not None:
+            register_row_cache_model(meta.model)
+
+        return new_class
+
 class ModelList(ModelInfoBase):
     """Automatic list creator for model classes, basing on QuerySets"""
+    __metaclass__ = ModelListMetaclass
     item_class = ModelListItem
 
     class _Meta(ModelInfoBase._Meta):
@@ -245,12 +398,39 @@ class ModelList(ModelInfoBase):
         icon_delete_template = '<a href="%(delete_url)s" title="Delete this" class="delete"><img src="%(media_url)simg/icon_deletelink.gif" alt="Edit"/></a>'
         group_template = '<tr><td colspan="%(cols)s" class="group"><h3>%(display)s</h3></td></tr>'
         groups = []
+        group_subtotals = False
+        group_summary_tr_template = '<tr class="subtotal">%(cells)s</tr>'
         show_header = True
         show_summary = True
         summary_fields = None
         summary_td_template = '<td class="%(field_name)s">%(value)s</td>'
         summary_tr_template = '<tr>%(cells)s</tr>'
+        summary_in_python = False
         ordering = None
+        auto_related = True
+        paginate_by = None
+        pagination = 'offset' # or 'keyset'
+        approximate_count = False
+        page_param = 'page'
+        cursor_param = 'cursor'
+        row_cache = False
+        row_cache_timeout = 60 * 30 # minutes
+        row_cache_version_field = 'updated_at'
+        row_cache_chunk_size = 100
+        export_chunk_size = 1000
+
+    rows_count = None
+    summary_totals = None
+    page = 1
+    cursor = None
+    next_cursor = None
+    has_next = False
+    _count = None
+    _row_cache_prefix = None
+    _row_cache_hits = None
+    _row_cache_previous_hits = None
+    _row_cache_new = None
+    _compiled_templates = None
 
     def __init__(self, queryset, *args, **kwargs):
         self.queryset = queryset
@@ -264,12 +444,27 @@ class ModelList(ModelInfoBase):
         for attr in ('model','fields','exclude','td_template','th_template','tr_template',
                 'thead_template','tbody_template','show_if_none','auto_urlize',
                 'auto_linebreaks','list_display_links','icon_edit_template',
-                'icon_delete_template','group_template','groups','show_header',
+                'icon_delete_template','group_template','groups','group_subtotals',
+                'group_summary_tr_template','show_header',
                 'summary_fields','summary_td_template','summary_tr_template','show_summary',
-                'ordering'):
+                'summary_in_python','ordering','auto_related','paginate_by','pagination',
+                'approximate_count','page_param','cursor_param','row_cache',
+                'row_cache_timeout','row_cache_version_field','row_cache_chunk_size',
+                'export_chunk_size'):
             if not hasattr(self._meta, attr):
                 setattr(self._meta, attr, getattr(_meta, attr))
 
+        # Pagination
+        if self._meta.paginate_by:
+            params = self.request and self.request.GET or {}
+
+            try:
+                self.page = max(int(kwargs.get('page', None) or params.get(self._meta.page_param, 1)), 1)
+            except ValueError:
+                self.page = 1
+
+            self.cursor = kwargs.get('cursor', None) or params.get(self._meta.cursor_param, None)
+
         # Replace "%s" for "%(value)s" on td_template to accept old uses
         self._meta.td_template = self._meta.td_template.replace(r'%s', r'%(value)s')
 
@@ -280,6 +475,38 @@ class ModelList(ModelInfoBase):
         else:
             return ''
 
+    def get_admin_media_prefix(self):
+        try:
+            return settings.ADMIN_MEDIA_PREFIX
+        except AttributeError:
+            return settings.STATIC_URL + '/admin/'
+
+    def get_compiled_templates(self):
+        """Returns the row templates split in static pieces, made once for the
+        instance. Rendering a row then only joins the pieces with its values."""
+        if self._compiled_templates is None:
+            admin_media_prefix = self.get_admin_media_prefix()
+            ret = {}
+
+            # Customized 'format_tr_by_template' methods are respected, and
+            # their tr_template can be in any format they use
+            if self.__class__.format_tr_by_template.im_func is ModelList.format_tr_by_template.im_func:
+                ret['tr'] = split_template(self._meta.tr_template)
+            else:
+                ret['tr'] = None
+
+            ret['cells'] = [split_template(self._meta.td_template, {'field_name': plan.name}, 'value')
+                    for plan in self.get_fields_plan()]
+
+            ret['edit'] = self._meta.icon_edit_template and split_template(
+                    self._meta.icon_edit_template, {'media_url': admin_media_prefix}, 'edit_url')
+            ret['delete'] = self._meta.icon_delete_template and split_template(
+                    self._meta.icon_delete_template, {'media_url': admin_media_prefix}, 'delete_url')
+
+            self._compiled_templates = ret
+
+        return self._compiled_templates
+
     def render_buttons_cell(self, instance, edit_url=None, delete_url=None, additional_code=''):
         """Renders the cell with util buttons for each row in the grid"""
         ret = []
@@ -288,16 +515,13 @@ class ModelList(ModelInfoBase):
         edit_url = edit_url or (url and url+'edit/' or '')
         delete_url = delete_url or (url and url+'delete/' or '')
 
-        try:
-            admin_media_prefix = settings.ADMIN_MEDIA_PREFIX
-        except AttributeError:
-            admin_media_prefix = settings.STATIC_URL + '/admin/'
+        compiled = self.get_compiled_templates()
 
-        if self._meta.icon_edit_template and edit_url:
-            ret.append(self._meta.icon_edit_template%{'edit_url':edit_url, 'media_url':admin_media_prefix})
+        if compiled['edit'] and edit_url:
+            ret.append(edit_url.join(compiled['edit']))
 
-        if self._meta.icon_delete_template and delete_url:
-            ret.append(self._meta.icon_delete_template%{'delete_url':delete_url, 'media_url':admin_media_prefix})
+        if compiled['delete'] and delete_url:
+            ret.append(delete_url.join(compiled['delete']))
 
         if ret:
             return '<td class="buttons">%s %s</td>'%(' '.join(ret), additional_code)
@@ -319,34 +543,168 @@ class ModelList(ModelInfoBase):
 
         return self._meta.thead_template %(''.join(thead) + self.render_buttons_header())
 
-    def get_queryset(self, ordering=True):
+    def get_queryset(self, ordering=True, related=True):
         try:
             if ordering and self._meta.ordering:
-                return self.queryset.order_by(*self._meta.ordering)
+                qs = self.queryset.order_by(*self._meta.ordering)
             else:
-                return self.queryset.all()
+                qs = self.queryset.all()
         except AttributeError:
             return self.queryset
 
+        if related and self._meta.auto_related:
+            qs = self.apply_related_lookups(qs)
+
+        return qs
+
+    def get_related_lookups(self):
+        """Returns a tuple with the lists of lookups for select_related and
+        prefetch_related, found from relations used by fields, groups and
+        list_display_links. It is found once and kept on the class."""
+        cls = self.__class__
+        ret = cls.__dict__.get('_related_lookups', None)
+
+        if ret is None:
+            if self._meta.model is None:
+                ret = ([], [])
+            else:
+                paths = list(self._meta.fields or self.get_model_fields()) +\
+                        list(self._meta.groups) + list(self._meta.list_display_links)
+                ret = get_related_lookups(self._meta.model, paths)
+            cls._related_lookups = ret
+
+        return ret
+
+    def apply_related_lookups(self, qs):
+        """Sets select_related and prefetch_related (Django 1.4+) on the queryset
+        to avoid a query per row for each relation shown in the grid. It can be
+        disabled by setting 'auto_related = False' on the Meta class."""
+        select_related, prefetch_related = self.get_related_lookups()
+
+        if select_related and getattr(qs.query, 'select_related', None) is not True:
+            qs = qs.select_related(*select_related)
+
+        if prefetch_related and hasattr(qs, 'prefetch_related'):
+            qs = qs.prefetch_related(*prefetch_related)
+
+        return qs
+
+    def get_saved_queries(self, rows_count=None):
+        """Returns an estimate of how many queries the automatic related lookups
+        saved for the given number of rows (default: the rows rendered by the
+        last call to 'rows')"""
+        if not self._meta.auto_related:
+            return 0
+
+        if rows_count is None:
+            rows_count = self.rows_count
+
+        if not rows_count:
+            return 0
+
+        select_related, prefetch_related = self.get_related_lookups()
+        select_steps = set()
+        for lookup in select_related:
+            parts = lookup.split('__')
+            select_steps.update(['__'.join(parts[:i+1]) for i in range(len(parts))])
+
+        return len(select_steps) * rows_count + len(prefetch_related) * (rows_count - 1)
+
+    def get_summary_function(self, spec):
+        """Returns the aggregation function name ('sum', 'avg', 'count', 'min' or
+        'max') for a declarative item of summary_fields, or None if it is a
+        callable to be called with the queryset. Raises ImproperlyConfigured for
+        an unknown function name."""
+        if isinstance(spec, basestring):
+            if spec.lower() not in SUMMARY_AGGREGATES:
+                raise ImproperlyConfigured('Unknown summary function "%s" in %s.Meta.summary_fields. '\
+                        'Use one of: %s'%(spec, self.__class__.__name__,
+                            ', '.join(sorted(SUMMARY_AGGREGATES.keys()))))
+
+            return spec.lower()
+
+        for name, aggregate in SUMMARY_AGGREGATES.items():
+            if spec is aggregate:
+                return name
+
+        return None
+
+    def get_summary_aggregates(self):
+        """Returns a dictionary with the aliases and the tuples (field name,
+        aggregate) for the declarative items of summary_fields"""
+        ret = {}
+
+        for f_name, spec in self._meta.summary_fields.items():
+            function = self.get_summary_function(spec)
+
+            if function is not None:
+                ret['summary_%d'%len(ret)] = (f_name,
+                        SUMMARY_AGGREGATES[function](f_name.replace('.', '__')))
+
+        return ret
+
+    def get_summary_values(self):
+        """Returns a dictionary with the summary value for each field in
+        summary_fields. Declarative items are computed together in a single
+        aggregate() query, or taken from the totals computed while the rows
+        were read when 'summary_in_python' is True."""
+        ret = {}
+        qs = None
+
+        for f_name, spec in self._meta.summary_fields.items():
+            if self.get_summary_function(spec) is None:
+                if qs is None:
+                    qs = self.get_queryset(related=False)
+                ret[f_name] = spec(qs)
+
+        if self.summary_totals is not None:
+            for f_name, total in self.summary_totals.items():
+                ret[f_name] = total.get_value()
+            return ret
+
+        aggregates = self.get_summary_aggregates()
+
+        if aggregates:
+            if qs is None:
+                qs = self.get_queryset(related=False)
+
+            values = qs.aggregate(**dict([(k, v[1]) for k, v in aggregates.items()]))
+
+            for k, v in aggregates.items():
+                ret[v[0]] = values[k]
+
+        return ret
+
     def summary(self):
         """Renders a summary with aggregation in the end of the grid.
         
         Uses the meta attributes:
             
          * show_summary
-         * summary_fields
+         * summary_fields - a dictionary with field names and their summary
+           functions. A function can be a callable to be called with the
+           queryset, or one of 'sum', 'avg', 'count', 'min' or 'max' (or the
+           respective aggregate classes), all of them computed by only one query
+         * summary_in_python - computes the declarative summary functions while
+           reading the rows, with no extra query. So they are totals of the rows
+           rendered: with 'paginate_by', only of the current page, while the
+           aggregate query gives totals of the whole list
          * summary_td_template
          * summary_tr_template
         """
-        fields = self._meta.fields or self.get_model_fields()
+        return self.render_summary_row(self.get_summary_values())
 
-        qs = self.get_queryset()
+    def render_summary_row(self, values, tr_template=None):
+        """Renders a row with the informed summary values for each field. It is
+        used for the summary in the end of the grid and for group subtotals"""
+        tr_template = tr_template or self._meta.summary_tr_template
+        fields = self._meta.fields or self.get_model_fields()
 
         tsummary = []
 
         for f_name in fields:
-            if f_name in self._meta.summary_fields:
-                val = self._meta.summary_fields[f_name](qs)
+            if f_name in values:
+                val = values[f_name]
             else:
                 val = '&nbsp'
             
@@ -358,7 +716,7 @@ class ModelList(ModelInfoBase):
                 'value': val,
                 })
 
-        return self._meta.summary_tr_template%{
+        return tr_template%{
                 'cells': ''.join(tsummary) + self.render_button_cell_summary(),
                 }
 
@@ -369,22 +727,207 @@ class ModelList(ModelInfoBase):
         fields = self._meta.fields or self.get_model_fields()
         return len(fields)+1
 
-    def rows(self):
-        """Iterator with the list of rows in the grid"""
+    def get_group_raw_value(self, f_name, obj):
+        """Returns the value used to find the group of an object. It is the
+        same value the database returns for the group field, with no display
+        formatting, so it's cheap to compare on every row."""
+        field = self.get_field(f_name)
+
+        if field is not None and isinstance(obj, models.Model):
+            return getattr(obj, field.attname)
+
+        try:
+            value = get_attr_value(obj, f_name)
+        except ObjectDoesNotExist:
+            return None
+
+        if isinstance(value, models.Model):
+            return value.pk
+
+        return value
+
+    def get_groups_info(self):
+        """Returns a dictionary with the database values for each group (rows
+        count in 'group_count' and subtotals), keyed by the tuple of group values.
+        Everything comes from only one values().annotate() query. An empty
+        dictionary is returned when the queryset doesn't support it (i.e. lists
+        or sliced querysets)."""
+        qs = self.get_queryset(ordering=False, related=False)
+
+        try:
+            if not qs.query.can_filter():
+                return {}
+        except AttributeError:
+            return {}
+
+        lookups = [g.replace('.', '__') for g in self._meta.groups]
+
+        aggregates = {}
+        if self._meta.group_subtotals and self._meta.summary_fields:
+            aggregates = self.get_summary_aggregates()
+
+        annotations = dict([(k, v[1]) for k, v in aggregates.items()])
+        annotations['group_count'] = models.Count('pk')
+
+        try:
+            values = list(qs.order_by().values(*lookups).annotate(**annotations))
+        except FieldError:
+            return {}
+
+        ret = {}
+
+        for item in values:
+            item['subtotals'] = dict([(v[0], item[k]) for k, v in aggregates.items()])
+            ret[tuple([item[l] for l in lookups])] = item
+
+        return ret
+
+    def get_ordering(self):
+        """Returns the ordering used for rows: groups first, then Meta.ordering
+        or, if it is not set, the ordering of the queryset. When the list is
+        paginated, the primary key is added to the end to make the order
+        deterministic."""
+        ordering = self._meta.ordering
+
+        if not ordering and isinstance(self.queryset, models.query.QuerySet):
+            ordering = get_queryset_ordering(self.queryset)
+
+        ret = [g.replace('.', '__') for g in self._meta.groups]
+        ret += [o for o in (ordering or ()) if o not in ret]
+
+        if self._meta.paginate_by and not [o for o in ret if o.lstrip('-') in ('pk', 'id')]:
+            ret.append('pk')
+
+        return ret
+
+    def paginate_queryset(self, qs):
+        """Returns a list with the objects for the current page and the first
+        object after it (or None). It reads just one row more than the page size,
+        so it doesn't count the rows to know if there is a next page.
+
+        The 'offset' pagination slices the queryset by the page number. The
+        'keyset' one filters the rows after the cursor (the ordering values of
+        the last row of the previous page), so deep pages cost the same as the
+        first one. Keyset pagination expects non-null ordering fields, and
+        relations are compared by the fields their models are ordered by. An
+        invalid cursor gives the first page."""
+        per_page = self._meta.paginate_by
+
+        if self._meta.pagination == 'keyset':
+            ordering = self.get_keyset_ordering()
+            values = self.cursor and decode_cursor(self.cursor) or None
+
+            if values is not None and len(values) == len(ordering):
+                try:
+                    qs = qs.filter(get_keyset_filter(ordering, values))
+                except (TypeError, ValueError, ValidationError):
+                    values = None
+            else:
+                values = None
+
+            if values is None:
+                self.cursor = None
+
+            objects = list(qs[:per_page+1])
+        else:
+            offset = (self.page - 1) * per_page
+            objects = list(qs[offset:offset+per_page+1])
+
+        self.has_next = len(objects) > per_page
+        after_last = self.has_next and objects[per_page] or None
+        objects = objects[:per_page]
+
+        if self.has_next and self._meta.pagination == 'keyset':
+            model = self._meta.model or self.queryset.model
+
+            try:
+                self.next_cursor = encode_cursor([get_lookup_value(objects[-1], o.lstrip('-'), model)
+                    for o in ordering])
+            except KeyError, e:
+                raise ImproperlyConfigured('%s can not be paginated by keyset: the rows have '\
+                        'no value for the ordering %s'%(self.__class__.__name__, e))
+
+        return objects, after_last
+
+    def get_keyset_ordering(self):
+        """Returns the ordering for keyset pagination, with relations replaced by
+        the fields their models are ordered by (see 'expand_ordering')"""
+        model = self._meta.model or self.queryset.model
+
+        try:
+            return expand_ordering(model, self.get_ordering())
+        except ValueError, e:
+            raise ImproperlyConfigured('%s can not be paginated by keyset: %s'%(
+                self.__class__.__name__, e))
+
+    def get_keyset_filter(self, values):
+        """Returns a Q object to get the rows after the informed ordering values"""
+        return get_keyset_filter(self.get_keyset_ordering(), values)
+
+    def get_count(self):
+        """Returns the count of rows in the whole list. If 'approximate_count' is
+        True, it is estimated from the database statistics when possible"""
+        if self._count is None:
+            qs = self.get_queryset(ordering=False, related=False)
+
+            if not isinstance(qs, models.query.QuerySet):
+                self._count = len(qs)
+            elif self._meta.approximate_count:
+                self._count = get_approximate_count(qs)
+            else:
+                self._count = qs.count()
+
+        return self._count
+
+    def get_num_pages(self):
+        if not self._meta.paginate_by:
+            return 1
+
+        return max((self.get_count() + self._meta.paginate_by - 1) / self._meta.paginate_by, 1)
+    num_pages = property(get_num_pages)
+
+    def get_has_previous(self):
+        if self._meta.pagination == 'keyset':
+            return bool(self.cursor)
+
+        return self.page > 1
+    has_previous = property(get_has_previous)
+
+    def rows(self, iterator=False):
+        """Iterator with the list of rows in the grid. If 'iterator' is True, the
+        queryset is read in chunks of 'export_chunk_size' rows (see
+        'iter_keyset'), so its result cache is never filled and prefetch_related
+        lookups still work."""
         fields = self._meta.fields or self.get_model_fields()
 
-        tbody = []
+        groups = self._meta.groups
+        groups_info = {}
+        groups_counts = {}
+        last_key = None
+        next_key = None
 
-        groups_values = {}
-        if self._meta.groups:
-            groups_values = groups_values.fromkeys(self._meta.groups)
+        if groups:
+            columns_count = self.get_columns_count()
+
+            # Counts and subtotals are found only if they are going to be shown
+            if self._meta.group_subtotals or '%(count)s' in self._meta.group_template:
+                groups_info = self.get_groups_info()
+
+            for key, item in groups_info.items():
+                for i in range(len(groups)):
+                    groups_counts[key[:i+1]] = groups_counts.get(key[:i+1], 0) + item['group_count']
 
         qs = self.get_queryset()
 
         try:
-            if self._meta.groups:
+            if groups or self._meta.paginate_by:
+                if self._meta.paginate_by and self._meta.pagination == 'keyset':
+                    ordering = self.get_keyset_ordering()
+                else:
+                    ordering = self.get_ordering()
+
                 try:
-                    qs = qs.order_by(*self._meta.groups)
+                    qs = qs.order_by(*ordering)
                 except AssertionError, e:
                     # Ignores the error if it doesn't get to order
                     if e.message != 'Cannot reorder a query once a slice has been taken.':
@@ -393,36 +936,193 @@ class ModelList(ModelInfoBase):
         except AttributeError:
             pass
 
-        for obj in qs:
+        # The next object after the page is used to know if the last group ends in it
+        after_last = None
+
+        if self._meta.paginate_by:
+            qs, after_last = self.paginate_queryset(qs)
+        elif iterator and isinstance(qs, models.query.QuerySet):
+            if qs.query.can_filter():
+                qs = iter_keyset(qs, self._meta.export_chunk_size)
+            else:
+                qs = qs.iterator()
+
+        self.rows_count = 0
+
+        # Summary totals computed in Python
+        totals = []
+        if self._meta.show_summary and self._meta.summary_fields and self._meta.summary_in_python:
+            self.summary_totals = {}
+
+            for f_name, spec in self._meta.summary_fields.items():
+                function = self.get_summary_function(spec)
+
+                if function is not None:
+                    self.summary_totals[f_name] = SummaryTotal(function)
+                    totals.append((f_name, self.summary_totals[f_name]))
+
+        if self._meta.row_cache:
+            qs = self.iter_with_row_cache(qs)
+
+        for obj, next_obj in with_next(qs, after_last):
+            self.rows_count += 1
+
+            for f_name, total in totals:
+                try:
+                    total.add(get_attr_value(obj, f_name))
+                except ObjectDoesNotExist:
+                    pass
+
             # Groups
             group_rows = []
 
-            if self._meta.groups:
-                for group in self._meta.groups:
-                    field_value = self.get_field_display_value(group, obj)
-                    if groups_values[group] != field_value:
-                        groups_values[group] = field_value
-                        group_row = self._meta.group_template%{'cols': self.get_columns_count(), 'display': field_value}
-                        group_rows.append(group_row)
+            if groups:
+                if next_key is None:
+                    key = tuple([self.get_group_raw_value(group, obj) for group in groups])
+                else:
+                    key = next_key
+
+                if key != last_key:
+                    for i, group in enumerate(groups):
+                        if last_key is None or key[:i+1] != last_key[:i+1]:
+                            field_value = self.get_field_display_value(group, obj)
+                            group_row = self._meta.group_template%{
+                                    'cols': columns_count,
+                                    'display': field_value,
+                                    'count': groups_counts.get(key[:i+1], ''),
+                                    }
+                            group_rows.append(group_row)
+
+                    last_key = key
 
             # Single row
-            row = self.render_single_object(obj)
+            if self._meta.row_cache:
+                row = self.render_cached_object(obj)
+            else:
+                row = self.render_single_object(obj)
+
+            # Group subtotals, after the last row of each group
+            if groups and self._meta.group_subtotals:
+                if next_obj is None:
+                    next_key = None
+                else:
+                    next_key = tuple([self.get_group_raw_value(group, next_obj) for group in groups])
+
+                if key != next_key and key in groups_info:
+                    row += '\n' + self.render_summary_row(
+                            groups_info[key]['subtotals'],
+                            self._meta.group_summary_tr_template,
+                            )
+
             ret = self.item_class(self, '\n'.join(group_rows) + row, obj)
             ret.obj = obj
 
             yield ret
 
+        if self._meta.row_cache:
+            self.flush_row_cache()
+
+    def get_row_cache_bucket(self):
+        """Returns a string identifying the group of users that see the same
+        rows. Extend it if rows depend on user permissions in other ways."""
+        user = getattr(self.request, 'user', None)
+
+        if user is None or not user.is_authenticated():
+            return 'anonymous'
+        elif user.is_superuser:
+            return 'superuser'
+        elif user.is_staff:
+            return 'staff'
+
+        return 'user'
+
+    def get_row_cache_prefix(self):
+        """Returns the first part of the row cache keys, with the list class,
+        current language and user bucket. When the model has no version field,
+        the model version (changed by save and delete signals) is in it too."""
+        cls = self.__class__
+        model = self._meta.model
+
+        ret = 'djangoplus:modellist:%s.%s:%s:%s'%(cls.__module__, cls.__name__,
+                get_language(), self.get_row_cache_bucket())
+
+        if not self.has_row_cache_version_field():
+            register_row_cache_model(model)
+            ret += ':' + get_row_cache_model_version(model)
+
+        return ret
+
+    def has_row_cache_version_field(self):
+        return bool(self._meta.row_cache_version_field) and \
+                self.get_field(self._meta.row_cache_version_field) is not None
+
+    def get_row_cache_key(self, obj):
+        if self._row_cache_prefix is None:
+            self._row_cache_prefix = self.get_row_cache_prefix()
+
+        if self.has_row_cache_version_field():
+            version = getattr(obj, self._meta.row_cache_version_field)
+            return '%s:%s:%s'%(self._row_cache_prefix, obj.pk,
+                    slugify(force_unicode(version)))
+
+        return '%s:%s'%(self._row_cache_prefix, obj.pk)
+
+    def iter_with_row_cache(self, objects):
+        """Iterates over the objects, loading their cached rows with only one
+        cache request for each chunk of 'row_cache_chunk_size' objects.
+
+        The rows loop reads one object ahead, so the next chunk is loaded
+        before the last object of the previous one is rendered. The hits of
+        the previous chunk are kept until then."""
+        self._row_cache_prefix = None
+        self._row_cache_hits = {}
+        self._row_cache_previous_hits = {}
+        self._row_cache_new = {}
+
+        for chunk in iter_chunks(objects, self._meta.row_cache_chunk_size):
+            self.flush_row_cache()
+            self._row_cache_previous_hits = self._row_cache_hits
+            self._row_cache_hits = cache.get_many([self.get_row_cache_key(obj) for obj in chunk])
+
+            for obj in chunk:
+                yield obj
+
+    def render_cached_object(self, obj):
+        """Returns the rendered row for the object from the row cache, or renders
+        it and keeps it to be stored by 'flush_row_cache'"""
+        key = self.get_row_cache_key(obj)
+
+        if key in self._row_cache_hits:
+            return self._row_cache_hits[key]
+        elif key in self._row_cache_previous_hits:
+            return self._row_cache_previous_hits[key]
+
+        ret = self._row_cache_new[key] = self.render_single_object(obj)
+        return ret
+
+    def flush_row_cache(self):
+        """Stores the rows rendered since the last flush in only one cache request"""
+        if self._row_cache_new:
+            cache.set_many(self._row_cache_new, self._meta.row_cache_timeout)
+            self._row_cache_new = {}
+
     def render_single_object(self, obj, tr_template=None, td_template=None):
         """Renders a single object. It is util internally or can be used for
         granulary customizations"""
         # Customized templates
+        if tr_template or td_template:
+            compiled = {'tr': None, 'cells': None}
+        else:
+            compiled = self.get_compiled_templates()
+
         tr_template = tr_template or self._meta.tr_template
         td_template = td_template or self._meta.td_template
 
-        fields = self._meta.fields or self.get_model_fields()
+        cells = compiled['cells']
         row = []
 
-        for i, f_name in enumerate(fields):
+        for i, plan in enumerate(self.get_fields_plan()):
+            f_name = plan.name
             f_value = self.get_field_display_value(f_name, obj)
             f_value = self.get_linkable_field_value(
                     obj, f_name, f_value,
@@ -432,13 +1132,19 @@ class ModelList(ModelInfoBase):
             if isinstance(f_value, decimal.Decimal):
                 f_value = moneyformat(f_value, None, app_settings.THOUSANDS_SEPARATOR)
 
-            if self._meta.show_if_none or f_value is not None:
-                row.append(td_template%{'field_name': f_name, 'value': f_value})
+            if not self._meta.show_if_none and f_value is None:
+                f_value = '&nbsp;'
+
+            if cells:
+                row.append(force_unicode(f_value).join(cells[i]))
             else:
-                row.append(td_template%{'field_name': f_name, 'value': '&nbsp;'})
+                row.append(td_template%{'field_name': f_name, 'value': f_value})
 
         tds = ''.join(row) + self.render_buttons_cell(obj)
 
+        if compiled['tr']:
+            return tds.join(compiled['tr'])
+
         return self.format_tr_by_template(obj, tr_template, tds)
 
     def format_tr_by_template(self, obj, tr_template, tds):
@@ -469,37 +1175,508 @@ class ModelList(ModelInfoBase):
 
         return mark_safe(ret)
 
-# JUST COPIED FROM GERALDO REPORTS
-def get_attr_value(obj, attr_path):
-    """This function gets an attribute value from an object. If the attribute
-    is a method with no arguments (or arguments with default values) it calls
-    the method. If the expression string has a path to a child attribute, it
-    supports.
-    
-    Examples:
-        
-        attribute_name = 'name'
-        attribute_name = 'name.upper'
-        attribute_name = 'customer.name.lower'
-    """
-    if not attr_path:
-        raise Exception('Invalid attribute path \'%s\''%attr_path)
+    def as_stream(self):
+        """Generator with the same HTML code as_string returns, but yielded in
+        chunks (header, rows and summary) and reading the queryset in chunks of
+        rows (see 'rows'). Returned by 'as_response', the memory keeps flat no
+        matter how many rows there are.
+
+        In templates it can be used as a piece of model_info_for_list:
+
+            {% model_info_for_list "myapp.info.ListUser" users as grid only as_stream %}
+            <table>{% for chunk in grid %}{{ chunk }}{% endfor %}</table>
+
+        There the queryset is still read in chunks, but the template joins all
+        of them in a single string, so the whole table is kept in memory."""
+        tbody_start, tbody_end = self._meta.tbody_template.split('%s', 1)
+        has_rows = False
+
+        for r in self.rows(iterator=True):
+            if has_rows:
+                yield mark_safe(u'\n' + r.row_str)
+            else:
+                has_rows = True
+
+                # THead
+                if self._meta.show_header:
+                    thead = self.header()
+                else:
+                    thead = ''
+
+                yield mark_safe(u'\n'.join([thead, tbody_start + r.row_str]))
+
+        if has_rows:
+            yield mark_safe(tbody_end)
+
+        # Summary
+        if self._meta.show_summary and self._meta.summary_fields:
+            yield mark_safe(self.summary())
+
+    def as_response(self, content_type='text/html'):
+        """Returns a streaming HTTP response with the grid HTML code"""
+        return StreamingHttpResponse(self.as_stream(), content_type=content_type)
+
+    # Exports
+
+    def get_field_export_value(self, f_name, obj):
+        """Returns the raw value of a field to be exported, with no HTML
+        formatting. Declare a method 'get_FIELD_export' to customize it."""
+        plan = self.get_field_plan(f_name)
+
+        if plan.export_method:
+            return getattr(self, plan.export_method)(obj)
+
+        try:
+            value = get_attr_value(obj, f_name)
+        except ObjectDoesNotExist:
+            return None
+
+        if isinstance(value, models.Model):
+            return unicode(value)
+
+        if isinstance(value, models.Manager):
+            return u', '.join(map(unicode, value.all()))
+
+        if plan.choices is not None:
+            return force_unicode(plan.choices.get(value, value))
+
+        return value
+
+    def iter_export_objects(self):
+        """Iterates over all objects of the list (pagination is ignored) in the
+        order of the rows, reading 'export_chunk_size' rows per query (see
+        'iter_keyset'), so the memory keeps bounded and the last chunks cost
+        the same as the first ones no matter how many rows are exported"""
+        qs = self.get_queryset()
+
+        if not isinstance(qs, models.query.QuerySet):
+            for obj in qs:
+                yield obj
+            return
+
+        if not qs.query.can_filter():
+            for obj in qs.iterator():
+                yield obj
+            return
+
+        if self._meta.groups:
+            qs = qs.order_by(*self.get_ordering())
+
+        for obj in iter_keyset(qs, self._meta.export_chunk_size):
+            yield obj
+
+    def export_rows(self):
+        """Iterates over lists with the export values of each object"""
+        plans = self.get_fields_plan()
+
+        for obj in self.iter_export_objects():
+            yield [self.get_field_export_value(plan.name, obj) for plan in plans]
+
+    def get_export_header(self):
+        return [unicode(self.get_field_display_text(plan.name)) for plan in self.get_fields_plan()]
+
+    def as_csv(self, header=True, **kwargs):
+        """Generator with the list exported to CSV (UTF-8), a line at a time.
+        Additional arguments are passed to csv.writer."""
+        buf = StringIO()
+        writer = csv.writer(buf, **kwargs)
+
+        def write_row(values):
+            writer.writerow([v is not None and force_unicode(v).encode('utf-8') or '' for v in values])
+            ret = buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            return ret
+
+        if header:
+            yield write_row(self.get_export_header())
+
+        for values in self.export_rows():
+            yield write_row(values)
+
+    def as_json_lines(self):
+        """Generator with the list exported to JSON Lines: an object (with field
+        names as keys) per line"""
+        names = [plan.name for plan in self.get_fields_plan()]
+
+        for values in self.export_rows():
+            yield simplejson.dumps(dict(zip(names, values)), cls=DjangoJSONEncoder) + '\n'
+
+    def as_spreadsheetml(self, header=True, sheet_name=None):
+        """Generator with the list exported to SpreadsheetML (the XML format of
+        Excel 2003), which spreadsheet applications open as a workbook"""
+        sheet_name = sheet_name or self.__class__.__name__
+
+        def make_row(values):
+            cells = []
+
+            for v in values:
+                if isinstance(v, (int, long, float, decimal.Decimal)) and not isinstance(v, bool):
+                    cells.append(u'<Cell><Data ss:Type="Number">%s</Data></Cell>'%v)
+                else:
+                    v = v is not None and force_unicode(v) or u''
+                    cells.append(u'<Cell><Data ss:Type="String">%s</Data></Cell>'%xml_escape(v))
+
+            return (u'<Row>%s</Row>\n'%u''.join(cells)).encode('utf-8')
+
+        yield SPREADSHEETML_START%{'sheet_name': xml_escape(sheet_name).encode('utf-8')}
+
+        if header:
+            yield make_row(self.get_export_header())
+
+        for values in self.export_rows():
+            yield make_row(values)
+
+        yield SPREADSHEETML_END
+
+    def export_response(self, format='csv', filename=None):
+        """Returns a streaming HTTP response with the list exported to the
+        informed format: 'csv', 'jsonl' or 'xml' (SpreadsheetML)"""
+        generator, content_type, extension = {
+                'csv': (self.as_csv, 'text/csv; charset=utf-8', 'csv'),
+                'jsonl': (self.as_json_lines, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+                'xml': (self.as_spreadsheetml, 'application/vnd.ms-excel', 'xml'),
+                }[format]
+
+        response = StreamingHttpResponse(generator(), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename=%s.%s'%(
+                filename or slugify(self.__class__.__name__), extension)
+
+        return response
+
+def get_related_lookups(model, paths):
+    """Returns a tuple with the lists of lookups for select_related and
+    prefetch_related needed to get the attribute paths informed (i.e.
+    'customer.type.name') from objects of the model class without a query
+    per object. Forward ForeignKey and OneToOne relations go to select_related,
+    while a ManyToMany field and everything after it go to prefetch_related."""
+    select_related, prefetch_related = [], []
 
-    parts = attr_path.split('.')
+    for path in paths:
+        cur_model = model
+        lookup = []
+        is_prefetch = False
+
+        for part in path.split('.'):
+            try:
+                field, f_model, direct, m2m = cur_model._meta.get_field_by_name(part)
+            except models.fields.FieldDoesNotExist:
+                break
+
+            if not direct or not getattr(field, 'rel', None):
+                break
+
+            lookup.append(part)
+            cur_model = field.rel.to
+            is_prefetch = is_prefetch or m2m
+
+        if not lookup:
+            continue
+
+        lookup = '__'.join(lookup)
+        lookups = is_prefetch and prefetch_related or select_related
+
+        if lookup not in lookups:
+            lookups.append(lookup)
+
+    return select_related, prefetch_related
+
+def with_next(iterable, last=None):
+    """Iterates over the items together with the next one of each. The item
+    after the last one is the informed 'last' argument"""
+    iterator = iter(iterable)
 
     try:
-        val = getattr(obj, parts[0])
-    except AttributeError:
+        cur = iterator.next()
+    except StopIteration:
+        return
+
+    for item in iterator:
+        yield cur, item
+        cur = item
+
+    yield cur, last
+
+def get_queryset_ordering(qs):
+    """Returns the list of lookups the queryset is ordered by: the ones given to
+    order_by() or the default ordering of the model"""
+    query = qs.query
+
+    if query.extra_order_by:
+        return list(query.extra_order_by)
+    elif query.order_by:
+        return list(query.order_by)
+    elif query.default_ordering:
+        return list(qs.model._meta.ordering)
+
+    return []
+
+def expand_ordering(model, ordering, _models=()):
+    """Returns the ordering with each relation replaced by the ordering of its
+    model (or by its primary key), as the database orders them, so every item
+    is a column that can be compared in a keyset filter. Raises ValueError for
+    an ordering that can't be compared: random, by expressions, by multi-valued
+    relations or by a lookup that is not a field."""
+    ret = []
+
+    for item in ordering:
+        if not isinstance(item, basestring) or item == '?':
+            raise ValueError('The ordering %r can not be compared by keyset'%(item,))
+
+        desc = item.startswith('-')
+        lookup = item.lstrip('-')
+        parts = lookup.split('__')
+        cur_model, field = model, None
+
+        for i, part in enumerate(parts):
+            if part == 'pk' and i == len(parts) - 1:
+                field = None
+                break
+
+            try:
+                field, f_model, direct, m2m = cur_model._meta.get_field_by_name(part)
+            except models.fields.FieldDoesNotExist:
+                raise ValueError('The ordering "%s" is not a field lookup'%item)
+
+            if not direct or m2m:
+                raise ValueError('The ordering "%s" is by a multi-valued relation'%item)
+
+            if i < len(parts) - 1:
+                if not getattr(field, 'rel', None):
+                    raise ValueError('The ordering "%s" is not a field lookup'%item)
+
+                cur_model = field.rel.to
+
+        if field is None or not getattr(field, 'rel', None):
+            ret.append(item)
+            continue
+
+        # Relations are ordered by the ordering of their model, if any
+        rel_model = field.rel.to
+
+        if not rel_model._meta.ordering:
+            ret.append('%s%s__pk'%(desc and '-' or '', lookup))
+            continue
+
+        if rel_model in _models:
+            raise ValueError('The ordering "%s" makes a loop of relations'%item)
+
+        for sub in expand_ordering(rel_model, rel_model._meta.ordering, _models + (rel_model,)):
+            sub_desc = sub.startswith('-')
+            ret.append('%s%s__%s'%(desc != sub_desc and '-' or '', lookup, sub.lstrip('-')))
+
+    return ret
+
+def is_nullable_lookup(model, lookup):
+    """Returns True if the column of an ordering lookup (as returned by
+    'expand_ordering') can be NULL, by itself or by a nullable relation in
+    its path"""
+    cur_model = model
+
+    for part in lookup.lstrip('-').split('__'):
+        if part == 'pk':
+            field = cur_model._meta.pk
+        else:
+            field = cur_model._meta.get_field_by_name(part)[0]
+
+        if field.null:
+            return True
+
+        if getattr(field, 'rel', None):
+            cur_model = field.rel.to
+
+    return False
+
+def get_lookup_value(obj, lookup, model=None):
+    """Returns the value of a lookup (i.e. 'customer__name') from an object.
+    The primary key of a relation is taken from its column, with no query.
+
+    Dictionaries (rows of values() querysets) have the lookup as key, and
+    'pk' is the name of the primary key of the informed model. KeyError is
+    raised if there is no such key."""
+    if isinstance(obj, dict):
+        if lookup == 'pk' and 'pk' not in obj and model is not None:
+            lookup = model._meta.pk.name
+
+        return obj[lookup]
+
+    parts = lookup.split('__')
+
+    for i, part in enumerate(parts):
+        if obj is None:
+            return None
+
+        if i == len(parts) - 2 and parts[-1] == 'pk' and isinstance(obj, models.Model):
+            try:
+                field = obj._meta.get_field(part)
+            except models.fields.FieldDoesNotExist:
+                field = None
+
+            if getattr(field, 'rel', None):
+                return getattr(obj, field.attname)
+
         try:
-            val = obj[parts[0]]
-        except (KeyError, TypeError):
-            raise Exception('There is no attribute nor key "%s" in the object "%s"'%(parts[0], repr(obj)))
+            obj = getattr(obj, part)
+        except ObjectDoesNotExist:
+            return None
 
-    if len(parts) > 1:
-        val = get_attr_value(val, '.'.join(parts[1:]))
+    return obj
 
-    if callable(val):
-        val = val()
-        
-    return val
+def get_keyset_filter(ordering, values):
+    """Returns a Q object to get the rows after the informed values of the
+    ordering lookups"""
+    ret = None
+
+    for i, lookup in enumerate(ordering):
+        q = models.Q(**{'%s__%s'%(lookup.lstrip('-'), lookup.startswith('-') and 'lt' or 'gt'): values[i]})
+
+        for prev_lookup, prev_value in zip(ordering[:i], values[:i]):
+            q &= models.Q(**{prev_lookup.lstrip('-'): prev_value})
+
+        if ret is None:
+            ret = q
+        else:
+            ret |= q
+
+    return ret
+
+def iter_keyset(qs, size):
+    """Iterates over the objects of a queryset reading 'size' rows per query,
+    keeping its order. Each query takes the rows after the ordering values of
+    the last row read (keyset), with the primary key added to the ordering to
+    make it unique, so the last chunks cost the same as the first ones. As each
+    chunk is a regular query, prefetch_related lookups are applied to it.
+
+    Orderings that can't be compared (see 'expand_ordering') or by columns
+    that can be NULL are read slicing by offset, as NULL values are never
+    after others in a keyset filter. So are rows of values() querysets with
+    no key for an ordering lookup."""
+    ordering = get_queryset_ordering(qs)
+    pk_names = ('pk', qs.model._meta.pk.name)
+
+    if not [o for o in ordering if isinstance(o, basestring) and o.lstrip('-') in pk_names]:
+        ordering.append('pk')
+
+    try:
+        if qs.query.extra_order_by:
+            raise ValueError('Extra orderings can not be compared by keyset')
+
+        ordering = expand_ordering(qs.model, ordering)
+        qs = qs.order_by(*ordering)
+        keyset = not [o for o in ordering if is_nullable_lookup(qs.model, o)]
+    except ValueError:
+        keyset = False
+
+    offset, values = 0, None
+
+    while True:
+        if values is None:
+            objects = list(qs[offset:offset+size])
+        else:
+            objects = list(qs.filter(get_keyset_filter(ordering, values))[:size])
+
+        for obj in objects:
+            yield obj
+
+        if len(objects) < size:
+            break
+
+        offset += size
+
+        if keyset:
+            try:
+                values = [get_lookup_value(objects[-1], lookup.lstrip('-'), qs.model)
+                        for lookup in ordering]
+            except KeyError:
+                keyset, values = False, None
+
+def encode_cursor(values):
+    """Encodes a list of ordering values as a string to be used in URLs. Values
+    JSON keeps as they are (booleans, numbers and None) are not converted, so
+    they are compared as the same type; the others go as unicode."""
+    ret = []
+    for v in values:
+        if v is not None and not isinstance(v, (bool, int, long, float)):
+            v = force_unicode(v)
+        ret.append(v)
+
+    return base64.urlsafe_b64encode(simplejson.dumps(ret))
+
+def decode_cursor(cursor):
+    """Decodes a cursor made by 'encode_cursor'. Returns None if it is not a
+    valid one (i.e. changed by hand or truncated)."""
+    try:
+        values = simplejson.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+    if not isinstance(values, list) or [v for v in values if isinstance(v, (list, dict))]:
+        return None
+
+    return values
+
+def get_approximate_count(qs):
+    """Returns the count of rows of a queryset with no filters estimated from
+    the database statistics, for PostgreSQL and MySQL. Otherwise, it returns
+    the exact count."""
+    connection = connections[qs.db]
+    vendor = getattr(connection, 'vendor', '')
+
+    if qs.query.where.children or qs.query.distinct or vendor not in ('postgresql', 'mysql'):
+        return qs.count()
+
+    cursor = connection.cursor()
+
+    if vendor == 'postgresql':
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [qs.model._meta.db_table])
+    else:
+        cursor.execute('SELECT table_rows FROM information_schema.tables '\
+                'WHERE table_schema = DATABASE() AND table_name = %s', [qs.model._meta.db_table])
+
+    row = cursor.fetchone()
+
+    if not row or not row[0]:
+        return qs.count()
+
+    return int(row[0])
+
+TEMPLATE_MARK = '\x00'
+
+SPREADSHEETML_START = """<?xml version="1.0" encoding="utf-8"?>
+<?mso-application progid="Excel.Sheet"?>
+<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet"
+ xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">
+<Worksheet ss:Name="%(sheet_name)s">
+<Table>
+"""
+
+SPREADSHEETML_END = """</Table>
+</Worksheet>
+</Workbook>
+"""
+
+def split_template(template, params=None, key=None):
+    """Formats the template with a mark in place of the informed key (or of the
+    single '%s' if there are no params) and returns the static pieces around
+    it, to be joined with the value later"""
+    if params is None:
+        return (template % TEMPLATE_MARK).split(TEMPLATE_MARK)
+
+    params = dict(params)
+    params[key] = TEMPLATE_MARK
+
+    return (template % params).split(TEMPLATE_MARK)
+
+def iter_chunks(iterable, size):
+    """Iterates over lists with 'size' items of the iterable each"""
+    chunk = []
+
+    for item in iterable:
+        chunk.append(item)
+
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
 
+    if chunk:
+        yield chunk
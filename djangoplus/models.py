@@ -1,4 +1,6 @@
-from django.db import models
+import time
+
+from django.db import models, transaction
 from django import template
 from django.template.defaultfilters import slugify
 from django.conf import settings
@@ -6,7 +8,143 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.utils.translation import get_language
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+try: # Django 1.6+
+    atomic = transaction.atomic
+except AttributeError:
+    atomic = transaction.commit_on_success
+
 import app_settings
+from djangoplus.utils.lrucache import LRUCache
+from djangoplus.utils.bulk import bulk_update
+
+UPDATE_BATCH_SIZE = 500
+
+DYNAMIC_TEMPLATE_VERSION_KEY = 'djangoplus:dynamictemplate:version'
+
+class DynamicTemplateManager(models.Manager):
+    """Keeps compiled templates in a process-local LRU cache, by primary key,
+    language and content hash, and the lists of templates for each slug and
+    group in a local index and in the shared cache. Saving or deleting a
+    dynamic template changes a version in the shared cache, so every process
+    clears its local caches and the shared keys of older versions expire.
+    Each process reads that version at most once in
+    DYNAMIC_TEMPLATE_VERSION_CHECK_INTERVAL seconds."""
+
+    compiled_templates = LRUCache(app_settings.DYNAMIC_TEMPLATE_CACHE_SIZE)
+    local_state = {'version': None, 'checked': None}
+    local_index = {}
+
+    def get_version(self):
+        version = cache.get(DYNAMIC_TEMPLATE_VERSION_KEY, None)
+
+        if version is None:
+            version = self.change_version()
+
+        return version
+
+    def change_version(self):
+        version = '%f'%time.time()
+        cache.set(DYNAMIC_TEMPLATE_VERSION_KEY, version, 60 * 60 * 24 * 30) # days
+        return version
+
+    def check_version(self):
+        """Clears the local caches if the dynamic templates were changed by
+        this or another process. The shared cache is read at most once in
+        DYNAMIC_TEMPLATE_VERSION_CHECK_INTERVAL seconds."""
+        now = time.time()
+        checked = self.local_state['checked']
+
+        if checked is not None and now - checked < app_settings.DYNAMIC_TEMPLATE_VERSION_CHECK_INTERVAL:
+            return
+
+        version = self.get_version()
+        self.local_state['checked'] = now
+
+        if version != self.local_state['version']:
+            self.clear_local_cache()
+            self.local_state['version'] = version
+
+    def clear_local_cache(self):
+        self.compiled_templates.clear()
+        self.local_index.clear()
+
+    def invalidate(self):
+        self.clear_local_cache()
+        self.local_state['version'] = self.change_version()
+        self.local_state['checked'] = time.time()
+
+    def make_index_cache_key(self, version, kind, value):
+        return 'djangoplus:dynamictemplate:%s:%s:%s'%(version, kind, value)
+
+    def get_templates(self, kind, value, prefetch=None):
+        """Returns the list of templates with a slug (kind 'slug') or in a group
+        (kind 'group'). If it is not in the local index, the pairs (kind, value)
+        in 'prefetch' are loaded together with it."""
+        self.check_version()
+
+        try:
+            return self.local_index[(kind, value)]
+        except KeyError:
+            pass
+
+        self.load_index([(kind, value)] + list(prefetch or []))
+
+        return self.local_index.get((kind, value), [])
+
+    def load_index(self, pairs):
+        """Loads the template lists for pairs (kind, value) into the local
+        index: first from the shared cache, then from the database with one
+        query for each kind"""
+        version = self.local_state['version']
+        missing = [pair for pair in pairs if pair not in self.local_index]
+        if not missing:
+            return
+
+        keys = dict([(self.make_index_cache_key(version, kind, value), (kind, value))
+            for kind, value in missing])
+
+        for key, templates in cache.get_many(keys.keys()).items():
+            self.local_index[keys[key]] = templates
+
+        missing = [pair for pair in missing if pair not in self.local_index]
+        if not missing:
+            return
+
+        found = {}
+        for kind in ('slug', 'group'):
+            values = set([value for k, value in missing if k == kind])
+            if not values:
+                continue
+
+            for tpl in self.filter(**{'%s__in'%kind: list(values)}):
+                found.setdefault((kind, getattr(tpl, kind)), []).append(tpl)
+
+        for kind, value in missing:
+            templates = found.get((kind, value), [])
+            cache.set(self.make_index_cache_key(version, kind, value), templates, 60 * 60 * 24) # hours
+            self.local_index[(kind, value)] = templates
+
+    def get_compiled_template(self, obj, content):
+        self.check_version()
+
+        if isinstance(content, unicode):
+            hashed = md5(content.encode('utf-8')).hexdigest()
+        else:
+            hashed = md5(content).hexdigest()
+
+        key = (obj.pk, get_language(), hashed)
+
+        tpl = self.compiled_templates.get(key, None)
+        if tpl is None:
+            tpl = template.Template(content)
+            self.compiled_templates.set(key, tpl)
+
+        return tpl
 
 class DynamicTemplate(models.Model):
     class Meta:
@@ -17,13 +155,16 @@ class DynamicTemplate(models.Model):
     group = models.SlugField(blank=True)
     content = models.TextField()
 
+    objects = DynamicTemplateManager()
+
     def __unicode__(self):
         return self.title
 
     def render(self, context):
         from djangoplus.translation import ugettext_field
         content = ugettext_field(self, 'content')
-        return template.Template(content).render(template.Context(context))
+        tpl = DynamicTemplate.objects.get_compiled_template(self, content)
+        return tpl.render(template.Context(context))
 
 class StaticFile(models.Model):
     file = models.FileField(upload_to=app_settings.STATIC_FILES_PATH)
@@ -48,6 +189,13 @@ def dynamictemplate_pre_save(sender, instance, signal, *args, **kwargs):
 
 signals.pre_save.connect(dynamictemplate_pre_save, sender=DynamicTemplate)
 
+def dynamictemplate_changed(sender, instance, **kwargs):
+    """Invalidates the compiled templates of all processes"""
+    sender.objects.invalidate()
+
+signals.post_save.connect(dynamictemplate_changed, sender=DynamicTemplate)
+signals.post_delete.connect(dynamictemplate_changed, sender=DynamicTemplate)
+
 # Signal that creates the 'view_*' permission
 from django.db.models import get_models
 from django.contrib.auth.management import _get_permission_codename
@@ -80,10 +228,39 @@ def create_permissions(app, created_models, verbosity, **kwargs):
 signals.post_syncdb.connect(create_permissions,
     dispatch_uid = "djangoplus.models.create_permissions")
 
+# Stored in cache for fields with no translation, so they are not looked for
+# in the database again
+NO_TRANSLATION = 'djangoplus:no-translation'
+
+# Part of the translation cache keys. Change it when the format of the cached
+# values changes, so entries written by other versions of the code are ignored
+# (raw translations are cached since this format, not the final values).
+TRANSLATIONS_CACHE_FORMAT = 'trf2'
+
+TRANSLATIONS_VERSION_KEY = 'djangoplus:translatedfield:version:%s'
+
 class TranslatedFieldManager(models.Manager):
+    """Translations are kept in cache as they are in the database (or as
+    NO_TRANSLATION when there is none), in two tiers: a process-local LRU cache
+    with a short timeout, in front of the shared cache.
+
+    A language can also be preloaded into a process-local dictionary, with all
+    its translations.
+
+    Local data is checked against a version of the language in the shared cache
+    (read at most once in TRANSLATIONS_VERSION_CHECK_INTERVAL seconds), which is
+    changed each time a translation of that language is saved or deleted."""
+
+    preloaded = {}
+    local_cache = LRUCache(app_settings.TRANSLATIONS_LOCAL_CACHE_SIZE,
+            app_settings.TRANSLATIONS_LOCAL_CACHE_TIMEOUT)
+    local_versions = {}
+    stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
     def make_cache_key_with_args(self, prefix, language, app_name, model_name, field_name, pk):
-        return '%s:%s:%s.%s.%s:%s'%(
+        return '%s:%s:%s:%s.%s.%s:%s'%(
             prefix,
+            TRANSLATIONS_CACHE_FORMAT,
             language,
             app_name,
             model_name,
@@ -114,15 +291,301 @@ class TranslatedFieldManager(models.Manager):
             trans.field_name,
             trans.object_id,
             )
-        cache.set(cache_key, None)
+        cache.delete(cache_key)
+
+        if trans.language:
+            self.change_version(format_language(trans.language))
 
     def get_from_cache(self, obj, field_name, language=None):
+        """Returns the translation in cache, NO_TRANSLATION if it is known there
+        is none or None if it is not in cache"""
         language = format_language(language or get_language())
-        return cache.get(self.make_cache_key(obj, field_name, language), None)
+        key = self.make_cache_key(obj, field_name, language)
+        local_key = (self.get_checked_version(language), key)
+
+        value = self.local_cache.get(local_key, None)
+        if value is not None:
+            self.stats['local_hits'] += 1
+            return value
+
+        value = cache.get(key, None)
+        if value is None:
+            self.stats['misses'] += 1
+        else:
+            self.stats['shared_hits'] += 1
+            self.local_cache.set(local_key, value)
+
+        return value
 
     def save_to_cache(self, obj, field_name, value, language=None):
         language = format_language(language or get_language())
-        return cache.set(self.make_cache_key(obj, field_name, language), value, 60 * 30) # minutes
+        key = self.make_cache_key(obj, field_name, language)
+        value = value or NO_TRANSLATION
+
+        self.local_cache.set((self.get_checked_version(language), key), value)
+        return cache.set(key, value, 60 * 30) # minutes
+
+    def get_many_from_cache(self, objects, field_names, language=None):
+        """Returns a dictionary {(object, field name): value} with the values
+        found in cache for the objects and fields, in a single round-trip to
+        the shared cache for those not in the local one"""
+        return self.get_pairs_from_cache([(obj, field_name)
+            for obj in objects for field_name in field_names], language)
+
+    def get_pairs_from_cache(self, pairs, language=None):
+        """The same as 'get_many_from_cache', but for a list of tuples
+        (object, field name)"""
+        language = format_language(language or get_language())
+        version = self.get_checked_version(language)
+
+        ret, keys = {}, {}
+        for obj, field_name in pairs:
+            key = self.make_cache_key(obj, field_name, language)
+            value = self.local_cache.get((version, key), None)
+
+            if value is None:
+                keys[key] = (obj, field_name)
+            else:
+                ret[(obj, field_name)] = value
+
+        self.stats['local_hits'] += len(ret)
+
+        if keys:
+            found = cache.get_many(keys.keys())
+
+            for key, value in found.items():
+                self.local_cache.set((version, key), value)
+                ret[keys[key]] = value
+
+            self.stats['shared_hits'] += len(found)
+            self.stats['misses'] += len(keys) - len(found)
+
+        return ret
+
+    def save_many_to_cache(self, values, language=None):
+        """Stores a dictionary {(object, field name): value} in cache"""
+        language = format_language(language or get_language())
+        version = self.get_checked_version(language)
+
+        data = dict([(self.make_cache_key(obj, field_name, language), value or NO_TRANSLATION)
+            for (obj, field_name), value in values.items()])
+
+        for key, value in data.items():
+            self.local_cache.set((version, key), value)
+
+        try:
+            cache.set_many(data, 60 * 30) # minutes
+        except AttributeError: # Django 1.2-
+            for key, value in data.items():
+                cache.set(key, value, 60 * 30)
+
+    def get_translations(self, content_type, object_ids, field_names, languages=None):
+        """Returns a dictionary {(object id, field name, language): translation}
+        with the existing translations of the objects and fields, read by a
+        single query"""
+        qs = self.filter(
+                content_type=content_type,
+                object_id__in=[unicode(object_id) for object_id in object_ids],
+                field_name__in=list(field_names),
+                )
+
+        if languages:
+            qs = qs.filter(language__in=[format_language(lang) for lang in languages])
+
+        return dict([((trans.object_id, trans.field_name, trans.language), trans) for trans in qs])
+
+    def create_missing_translations(self, content_type, object_ids, field_names, languages=None):
+        """Creates together the empty translations not in the database yet, for
+        each object, field and language (all of settings.LANGUAGES by default).
+        Returns all of them, like 'get_translations'"""
+        languages = [format_language(lang) for lang in (languages or [l for l, d in settings.LANGUAGES])]
+        object_ids = [unicode(object_id) for object_id in object_ids]
+
+        existing = self.get_translations(content_type, object_ids, field_names, languages)
+
+        new_translations = [self.model(
+                    content_type=content_type,
+                    object_id=object_id,
+                    field_name=field_name,
+                    language=language,
+                    )
+                for object_id in object_ids
+                for field_name in field_names
+                for language in languages
+                if (object_id, field_name, language) not in existing]
+
+        if not new_translations:
+            return existing
+
+        self.bulk_insert(new_translations)
+
+        # Reads again to get the primary keys
+        return self.get_translations(content_type, object_ids, field_names, languages)
+
+    @atomic
+    def set_translations(self, values):
+        """Saves a dictionary {(content type, object id, field name, language): value},
+        within a transaction. Existing translations are read with one query
+        for each content type and block of objects; the new ones are created
+        together and the changed ones are updated in batches of
+        UPDATE_BATCH_SIZE. Signals are not sent, so the cache keys of the saved
+        translations are invalidated together at the end.
+
+        Returns a tuple (created count, updated count)."""
+
+        # Groups by content type
+        by_content_type = {}
+        for (content_type, object_id, field_name, language), value in values.items():
+            if not isinstance(content_type, ContentType):
+                content_type = ContentType.objects.get_for_id(content_type)
+
+            by_content_type.setdefault(content_type, {})[
+                    (unicode(object_id), field_name, format_language(language))] = value
+
+        new_translations, updates, changed = [], [], []
+
+        for content_type, ct_values in by_content_type.items():
+            object_ids = list(set([k[0] for k in ct_values.keys()]))
+            field_names = list(set([k[1] for k in ct_values.keys()]))
+            languages = list(set([k[2] for k in ct_values.keys()]))
+
+            existing = {}
+            for i in range(0, len(object_ids), UPDATE_BATCH_SIZE):
+                existing.update(self.get_translations(content_type,
+                    object_ids[i:i+UPDATE_BATCH_SIZE], field_names, languages))
+
+            for (object_id, field_name, language), value in ct_values.items():
+                trans = existing.get((object_id, field_name, language), None)
+
+                if trans is None:
+                    new_translations.append(self.model(
+                        content_type=content_type,
+                        object_id=object_id,
+                        field_name=field_name,
+                        language=language,
+                        value=value,
+                        ))
+                elif trans.value != value:
+                    updates.append((trans.pk, value))
+                else:
+                    continue
+
+                changed.append((content_type, object_id, field_name, language))
+
+        if new_translations:
+            self.bulk_insert(new_translations)
+
+        self.update_values(updates)
+        self.invalidate_translations(changed)
+
+        return len(new_translations), len(updates)
+
+    def bulk_insert(self, translations):
+        if hasattr(self, 'bulk_create'): # Django 1.4+
+            for i in range(0, len(translations), UPDATE_BATCH_SIZE):
+                self.bulk_create(translations[i:i+UPDATE_BATCH_SIZE])
+        else:
+            for trans in translations:
+                trans.save()
+
+    def update_values(self, updates):
+        """Updates a list of (primary key, value) with an UPDATE ... CASE query
+        for each UPDATE_BATCH_SIZE translations"""
+        bulk_update(self.model, [(pk, {'value': value}) for pk, value in updates],
+                batch_size=UPDATE_BATCH_SIZE)
+
+    def invalidate_translations(self, keys):
+        """Removes from cache the translations for a list of (content type,
+        object id, field name, language) and changes the versions of their
+        languages"""
+        cache_keys = [self.make_cache_key_with_args(
+                settings.CACHE_MIDDLEWARE_KEY_PREFIX,
+                language,
+                content_type.model_class()._meta.app_label,
+                content_type.model_class().__name__,
+                field_name,
+                object_id,
+                ) for content_type, object_id, field_name, language in keys]
+
+        if hasattr(cache, 'delete_many'): # Django 1.2+
+            cache.delete_many(cache_keys)
+        else:
+            for key in cache_keys:
+                cache.delete(key)
+
+        for language in set([language for content_type, object_id, field_name, language in keys]):
+            if language:
+                self.change_version(language)
+
+    def get_cache_stats(self):
+        """Returns the counters of hits in the local and the shared cache and of
+        misses, for monitoring"""
+        ret = dict(self.stats)
+        ret['local_size'] = len(self.local_cache)
+        return ret
+
+    def reset_cache_stats(self):
+        for key in self.stats.keys():
+            self.stats[key] = 0
+
+    def get_version(self, language):
+        version = cache.get(TRANSLATIONS_VERSION_KEY%language, None)
+
+        if version is None:
+            version = self.change_version(language)
+
+        return version
+
+    def change_version(self, language):
+        version = '%f'%time.time()
+        cache.set(TRANSLATIONS_VERSION_KEY%language, version, 60 * 60 * 24 * 30) # days
+
+        # Drops this process' copy at once
+        self.local_versions[language] = (version, time.time())
+        self.preloaded.pop(language, None)
+
+        return version
+
+    def get_checked_version(self, language):
+        """Returns the version of a language, read from the shared cache at most
+        once in TRANSLATIONS_VERSION_CHECK_INTERVAL seconds"""
+        now = time.time()
+        data = self.local_versions.get(language, None)
+
+        if data is None or now - data[1] >= app_settings.TRANSLATIONS_VERSION_CHECK_INTERVAL:
+            data = (self.get_version(language), now)
+            self.local_versions[language] = data
+
+        return data[0]
+
+    def preload(self, language=None):
+        """Loads all translations of a language into a process-local dictionary
+        {(content type id, object id, field name): value}"""
+        language = format_language(language or get_language())
+        version = self.get_checked_version(language)
+
+        values = dict([((content_type_id, object_id, field_name), value)
+            for content_type_id, object_id, field_name, value in self.filter(language=language).values_list(
+                'content_type', 'object_id', 'field_name', 'value')])
+
+        self.preloaded[language] = {'version': version, 'values': values}
+
+        return values
+
+    def get_preloaded(self, language=None):
+        """Returns the preloaded dictionary for a language, if it was preloaded
+        and is still valid, or None"""
+        language = format_language(language or get_language())
+
+        data = self.preloaded.get(language, None)
+        if data is None:
+            return None
+
+        if self.get_checked_version(language) != data['version']:
+            self.preloaded.pop(language, None)
+            return None
+
+        return data['values']
 
 class TranslatedField(models.Model):
     class Meta:
@@ -155,4 +618,72 @@ def translatedfield_post_save(sender, instance, **kwargs):
     sender.objects.delete_from_cache(instance)
 
 models.signals.post_save.connect(translatedfield_post_save, sender=TranslatedField)
+models.signals.post_delete.connect(translatedfield_post_save, sender=TranslatedField)
+
+# ModelList row cache (see djangoplus.model_info)
+
+ROW_CACHE_VERSION_TIMEOUT = 60 * 60 * 24 * 30 # days
+
+def get_row_cache_version_key(model):
+    return 'djangoplus:modellist:version:%s.%s'%(model._meta.app_label, model.__name__)
+
+def get_row_cache_model_version(model):
+    """Returns the current version of the rows cached for the model class"""
+    key = get_row_cache_version_key(model)
+    version = cache.get(key, None)
+
+    if version is None:
+        version = '%f'%time.time()
+        cache.set(key, version, ROW_CACHE_VERSION_TIMEOUT)
+
+    return version
+
+def row_cache_invalidate(sender, instance, **kwargs):
+    """Changes the version of the rows cached for the model class (and for the
+    models it is a proxy or a child of), so all of them are rendered again"""
+    model_classes = [sender]
+    while model_classes[-1]._meta.proxy and model_classes[-1]._meta.proxy_for_model:
+        model_classes.append(model_classes[-1]._meta.proxy_for_model)
+
+    for model in list(model_classes):
+        model_classes.extend([m for m in model._meta.get_parent_list() if m not in model_classes])
+
+    version = '%f'%time.time()
+
+    for model in model_classes:
+        cache.set(get_row_cache_version_key(model), version, ROW_CACHE_VERSION_TIMEOUT)
+
+_row_cache_models = set()
+
+def register_row_cache_model(model):
+    """Connects the post_save and post_delete signals of the model class to
+    'row_cache_invalidate'. It is done for the model of each ModelList class
+    declaring 'row_cache' when the list class is defined, and for the models
+    in setting ROW_CACHE_MODELS when they are loaded. Other models are not
+    affected, so their changes make no cache request."""
+    if model in _row_cache_models:
+        return
+
+    _row_cache_models.add(model)
+
+    dispatch_uid = 'djangoplus.models.row_cache:%s.%s'%(model._meta.app_label, model.__name__)
+    models.signals.post_save.connect(row_cache_invalidate, sender=model, dispatch_uid=dispatch_uid)
+    models.signals.post_delete.connect(row_cache_invalidate, sender=model, dispatch_uid=dispatch_uid)
+
+def row_cache_class_prepared(sender, **kwargs):
+    """Registers the models listed in setting ROW_CACHE_MODELS"""
+    name = ('%s.%s'%(sender._meta.app_label, sender.__name__)).lower()
+
+    if name in [m.lower() for m in app_settings.ROW_CACHE_MODELS]:
+        register_row_cache_model(sender)
+
+if app_settings.ROW_CACHE_MODELS:
+    from django.db.models.loading import cache as model_cache
+
+    # Models loaded before this module
+    for app_models in model_cache.app_models.values():
+        for model in app_models.values():
+            row_cache_class_prepared(model)
 
+    models.signals.class_prepared.connect(row_cache_class_prepared,
+            dispatch_uid='djangoplus.models.row_cache_class_prepared')
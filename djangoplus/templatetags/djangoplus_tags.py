@@ -11,7 +11,8 @@ from django.core.cache import cache
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
-from djangoplus.utils import path_to_object, split1000, get_admin_url
+from djangoplus.utils import path_to_object, get_admin_url, get_attr_value
+from djangoplus.utils.numberformat import get_number_format
 from djangoplus import app_settings
 
 register = Library()
@@ -124,15 +125,7 @@ def inc_month(value,arg):
 @register.filter
 def list_as_text(value, field=None):
     if field:
-        def get_value(obj, attr):
-            attr = getattr(obj, attr)
-
-            if type(attr) == types.MethodType:
-                return attr()
-
-            return attr or ''
-
-        return ', '.join([get_value(i, field) for i in value])
+        return ', '.join([get_attr_value(i, field) or '' for i in value])
     else:
         return ', '.join([unicode(i) for i in value])
 
@@ -273,30 +266,13 @@ def make_cloud(object_list, count_attribute, steps=5):
 @register.filter_function
 def moneyformat(value, decimal_places=2, thousands_separator=''):
     """Returns a float value in monetary format, using MONETARY_LOCALE
-    setting and locale functions"""
+    setting and locale conventions (read only once for each locale)"""
     decimal_places = decimal_places is None and 2 or decimal_places
     thousands_separator = thousands_separator or app_settings.THOUSANDS_SEPARATOR
 
-    import locale
-
-    if app_settings.MONETARY_LOCALE:
-        locale.setlocale(locale.LC_NUMERIC, app_settings.MONETARY_LOCALE)
-
-    format = r"%0.0"+str(decimal_places)+'f'
-
-    value = value or 0.0
-
-    ret = locale.format(format, float(value), grouping=True)
+    number_format = get_number_format(app_settings.MONETARY_LOCALE, thousands_separator)
 
-    if thousands_separator:
-        dec_sep = thousands_separator == ',' and '.' or ','
-        parts = ret.split(dec_sep)
-        ret = split1000(parts[0].replace(thousands_separator, ''), thousands_separator)
-
-        if len(parts) > 1:
-            ret += dec_sep + parts[1]
-
-    return ret
+    return number_format.format(value, int(decimal_places))
 
 @register.filter_function
 def has_module_perm(user, app_label):
@@ -365,18 +341,22 @@ from djangoplus.models import DynamicTemplate
 class DynamicTemplateRender(template.Node):
     slug = None
     is_group = False
+    siblings = None
 
-    def __init__(self, slug, is_group=False):
+    def __init__(self, slug, is_group=False, siblings=None):
         self.slug = slug
         self.is_group = is_group
+        self.siblings = siblings is None and [] or siblings
 
     def render(self, context):
         ret = ''
 
-        if self.is_group:
-            templates = DynamicTemplate.objects.filter(group=self.slug)
-        else:
-            templates = DynamicTemplate.objects.filter(slug=self.slug)
+        # The first render loads all dynamic templates used by the template
+        templates = DynamicTemplate.objects.get_templates(
+                self.is_group and 'group' or 'slug',
+                self.slug,
+                prefetch=self.siblings,
+                )
 
         for tpl in templates:
             ret += tpl.render(context)
@@ -399,7 +379,14 @@ def do_dynamic_template(parser, token):
         raise template.TemplateSyntaxError, "%s requires 1 or 2 arguments" \
                 % token.contents.split()[0]
 
-    return DynamicTemplateRender(slugify(slug), is_group)
+    # All nodes in the same template share the list of slugs and groups used
+    if not hasattr(parser, 'dynamic_templates_used'):
+        parser.dynamic_templates_used = []
+
+    slug = slugify(slug)
+    parser.dynamic_templates_used.append((is_group and 'group' or 'slug', slug))
+
+    return DynamicTemplateRender(slug, is_group, parser.dynamic_templates_used)
 
 register.tag('dynamic_template', do_dynamic_template)
 
@@ -497,23 +484,42 @@ register.tag('remove_from_get_params', do_remove_from_get_params)
 
 # Model info
 
-class ModelInfoForObjectNode(template.Node):
+class ClassPathNode(template.Node):
+    """Base node for tags receiving a class path. When the path is a quoted
+    string it is resolved once, at parse time, instead of on every render."""
     class_path = None
+    cls = None
+
+    def set_class_path(self, class_path):
+        self.class_path = template.Variable(class_path)
+
+        if self.class_path.literal is not None:
+            try:
+                self.cls = path_to_object(self.class_path.literal)
+            except (ImportError, AttributeError):
+                pass # Tries again on render, where the error is raised
+
+    def get_class(self, context):
+        if self.cls is not None:
+            return self.cls
+
+        return path_to_object(self.class_path.resolve(context))
+
+class ModelInfoForObjectNode(ClassPathNode):
     obj = None
     as_part = None
     as_varname = None
 
     def __init__(self, class_path, obj, as_part=None, as_varname=None):
-        self.class_path = template.Variable(class_path)
+        self.set_class_path(class_path)
         self.obj = template.Variable(obj)
         self.as_part = as_part
         self.as_varname = as_varname
 
     def render(self, context):
-        class_path = self.class_path.resolve(context)
         obj = self.obj.resolve(context)
 
-        cls = path_to_object(class_path)
+        cls = self.get_class(context)
         model_info = cls(obj, request=context.get('request', None))
 
         if not self.as_part:
@@ -535,23 +541,21 @@ def do_model_info_for_object(parser, token):
 register.tag('model_info_for_object', do_model_info_for_object)
 
 
-class ModelInfoForListNode(template.Node):
-    class_path = None
+class ModelInfoForListNode(ClassPathNode):
     list_obj = None
     as_varname = None
     piece = None
 
     def __init__(self, class_path, list_obj, as_varname=None, piece=None):
-        self.class_path = template.Variable(class_path)
+        self.set_class_path(class_path)
         self.list_obj = template.Variable(list_obj)
         self.as_varname = as_varname
         self.piece = piece
 
     def render(self, context):
-        class_path = self.class_path.resolve(context)
         list_obj = self.list_obj.resolve(context)
 
-        cls = path_to_object(class_path)
+        cls = self.get_class(context)
         model_list = cls(list_obj, request=context.get('request', None))
 
         if self.piece:
@@ -567,7 +571,12 @@ class ModelInfoForListNode(template.Node):
         return ''
 
 def do_model_info_for_list(parser, token):
-    """Returns the model informations for a list: a table with a list of objects"""
+    """Returns the model informations for a list: a table with a list of objects.
+
+    Use "only as_stream" together with "as" to get a generator of HTML chunks
+    instead of the whole table in a single string. The rows are read in chunks,
+    but the rendered template is still a single string: to keep the memory flat
+    for big lists, return ModelList.as_response from the view instead."""
 
     try:
         parts = token.split_contents()
@@ -592,18 +601,15 @@ def do_model_info_for_list(parser, token):
 
 register.tag('model_info_for_list', do_model_info_for_list)
 
-class ModelInfoFields(template.Node):
-    class_path = None
+class ModelInfoFields(ClassPathNode):
     as_varname = None
 
     def __init__(self, class_path, as_varname=None):
-        self.class_path = template.Variable(class_path)
+        self.set_class_path(class_path)
         self.as_varname = as_varname
 
     def render(self, context):
-        class_path = self.class_path.resolve(context)
-
-        cls = path_to_object(class_path)
+        cls = self.get_class(context)
         m_obj = cls(None, request=context.get('request', None))
         fields = [(f, m_obj.get_field_display_text(f)) for f in m_obj._meta.fields]
 
@@ -6,7 +6,8 @@ from django.utils.safestring import mark_safe
 from django.template.defaultfilters import title, linebreaks, escape
 from django.core.urlresolvers import reverse
 
-from djangoplus.translation import ugettext_field
+from djangoplus.translation import ugettext_field, prefetch_translations, get_prefetched,\
+        get_translation_batch, start_translation_batch, end_translation_batch
 
 register = template.Library()
 
@@ -26,9 +27,16 @@ class TransFieldNode(template.Node):
         if obj is None:
             return ''
 
-        value = ugettext_field(obj, self.field_name)
+        # Inside a block 'translation_batch', translations are found together
+        # at its end
+        batch = get_translation_batch()
+        if batch is not None and get_prefetched(obj, self.field_name) is None:
+            return batch.defer(obj, self.field_name, self.format_value)
 
-        if not value:
+        return self.format_value(ugettext_field(obj, self.field_name), obj)
+
+    def format_value(self, value, obj=None):
+        if not value and obj is not None:
             value = getattr(obj, self.field_name, '')
 
         value = unicode(value)
@@ -54,6 +62,70 @@ def trans_field(parser, token):
 
     return TransFieldNode(obj, field_name, safe, title, linebreaks, upper, escape)
 
+class PrefetchTranslationsNode(template.Node):
+    def __init__(self, objects, field_names, as_varname):
+        self.objects = template.Variable(objects)
+        self.field_names = field_names
+        self.as_varname = as_varname
+
+    def render(self, context):
+        objects = self.objects.resolve(context) or []
+
+        context[self.as_varname] = prefetch_translations(objects, self.field_names)
+        return ''
+
+@register.tag
+def prefetch_translations_for(parser, token):
+    """Loads the translations of some fields for a list of objects at once, so
+    'trans_field' doesn't look for them one by one.
+
+    Usage: {% prefetch_translations_for object_list "name,description" as objects %}"""
+    parts = token.split_contents()
+
+    if len(parts) != 5 or parts[3] != 'as':
+        raise template.TemplateSyntaxError, "You must inform the list, the field names, 'as' and the output variable name"
+
+    field_names = [f.strip() for f in parts[2].strip('"\'').split(',') if f.strip()]
+
+    return PrefetchTranslationsNode(parts[1], field_names, parts[4])
+
+class TranslationBatchNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        previous = get_translation_batch()
+        batch = start_translation_batch()
+
+        try:
+            content = self.nodelist.render(context)
+        finally:
+            end_translation_batch(previous)
+
+        return mark_safe(batch.replace(content))
+
+@register.tag
+def translation_batch(parser, token):
+    """Finds the translations of all 'trans_field' tags inside the block at
+    once: with one cache round-trip and one query for each model class. Each
+    tag renders a placeholder that is replaced at the end of the block, so no
+    placeholder is left outside it.
+
+    Usage:
+
+        {% translation_batch %}
+        {% for product in products %}<li>{% trans_field product name %}</li>{% endfor %}
+        {% endtranslation_batch %}
+
+    As the translations are only known at the end of the block, 'trans_field'
+    tags must not be inside blocks that change or store their output before
+    that, as 'cache', 'filter' or 'spaceless'. Put those blocks around the
+    'translation_batch' one instead."""
+    nodelist = parser.parse(('endtranslation_batch',))
+    parser.delete_first_token()
+
+    return TranslationBatchNode(nodelist)
+
 ADMIN_FIELDS_SCRIPT_TPL = """
 <style type="text/css">
     .set_translation {
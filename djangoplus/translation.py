@@ -1,8 +1,15 @@
+import re, random, threading
+
 from django.conf import settings
 from django.utils.translation import get_language
 from django.contrib.contenttypes.models import ContentType
 
-from djangoplus.models import TranslatedField, format_language
+from djangoplus.models import TranslatedField, format_language, NO_TRANSLATION
+from djangoplus import app_settings
+
+PREFETCHED_ATTR = '_prefetched_translations'
+
+_batches = threading.local()
 
 def ugettext_field(obj, field_name):
     """
@@ -12,33 +19,191 @@ def ugettext_field(obj, field_name):
     the current field value if it doesn't exist or just it's empty.
     """
 
-    # Gets from cache if it exists
-    cached_value = TranslatedField.objects.get_from_cache(obj, field_name)
-    if cached_value:
-        return cached_value
+    language = format_language(get_language())
+
+    # Gets from translations prefetched by 'prefetch_translations'
+    prefetched = get_prefetched(obj, field_name, language)
+    if prefetched is not None:
+        return prefetched
 
     c_type = ContentType.objects.get_for_model(obj)
 
-    try:
-        trans = TranslatedField.objects.get(
-                language=format_language(get_language()),
-                content_type=c_type,
-                object_id=obj.pk,
-                field_name=field_name,
-                )
-        result = trans.value
-    except TranslatedField.DoesNotExist:
-        result = ''
+    # Gets from the language preloaded in this process, if so
+    preloaded = TranslatedField.objects.get_preloaded(language)
+    if preloaded is None and app_settings.TRANSLATIONS_PRELOAD:
+        preloaded = TranslatedField.objects.preload(language)
+
+    if preloaded is not None:
+        result = preloaded.get((c_type.pk, unicode(obj.pk), field_name), '')
+        return make_field_translation(obj, field_name, result)
+
+    # Gets from cache if it exists
+    result = TranslatedField.objects.get_from_cache(obj, field_name, language)
+
+    if result is None:
+        try:
+            trans = TranslatedField.objects.get(
+                    language=language,
+                    content_type=c_type,
+                    object_id=obj.pk,
+                    field_name=field_name,
+                    )
+            result = trans.value
+        except TranslatedField.DoesNotExist:
+            result = ''
+
+        # Stores in cache, even if there is no translation
+        TranslatedField.objects.save_to_cache(obj, field_name, result, language)
+
+    return make_field_translation(obj, field_name, result)
+
+def get_prefetched(obj, field_name, language=None):
+    """Returns the translation attached to the object by 'prefetch_translations'
+    or None if there is none"""
+    prefetched = getattr(obj, PREFETCHED_ATTR, None)
+    if not prefetched:
+        return None
 
+    return prefetched.get((format_language(language or get_language()), field_name), None)
+
+def make_field_translation(obj, field_name, result, language=None):
     # If doesn't exists or is empty, get field value instead
-    if not unicode(result).strip():
+    if result == NO_TRANSLATION or not unicode(result).strip():
         result = getattr(obj, field_name)
 
     # Replaces static URLs for that including current language
-    result = result.replace('/static/','/static/%s/' % get_language())
+    return result.replace('/static/','/static/%s/' % (language or get_language()))
+
+def prefetch_translations(objects, field_names, language=None):
+    """
+    Finds the translations of the given fields for all objects at once: with one
+    cache round-trip and one query for each model class for those not in cache.
+    The results are attached to the objects, so ugettext_field and the tag
+    'trans_field' use them with no other lookup.
+
+    Returns the list of objects.
+    """
+    objects = list(objects)
+
+    prefetch_translation_pairs([(obj, field_name)
+        for obj in objects for field_name in field_names], language)
+
+    return objects
+
+def prefetch_translation_pairs(pairs, language=None):
+    """
+    The same as 'prefetch_translations', but for a list of tuples (object,
+    field name), so only the translations of those fields are found (the
+    objects may be of different model classes, with different fields).
+    """
+    language = format_language(language or get_language())
+
+    results = TranslatedField.objects.get_pairs_from_cache(pairs, language)
+
+    # Groups the missing translations by model class
+    missing = {}
+    for obj, field_name in pairs:
+        if (obj, field_name) not in results:
+            missing.setdefault(obj.__class__, []).append((obj, field_name))
+
+    found = {}
+    for model, model_pairs in missing.items():
+        c_type = ContentType.objects.get_for_model(model)
+
+        translations = TranslatedField.objects.filter(
+                language=language,
+                content_type=c_type,
+                object_id__in=list(set([unicode(obj.pk) for obj, field_name in model_pairs])),
+                field_name__in=list(set([field_name for obj, field_name in model_pairs])),
+                ).values_list('object_id', 'field_name', 'value')
+
+        values = dict([((object_id, field_name), value)
+            for object_id, field_name, value in translations])
+
+        for obj, field_name in model_pairs:
+            found[(obj, field_name)] = values.get((unicode(obj.pk), field_name), '')
+
+    if found:
+        TranslatedField.objects.save_many_to_cache(found, language)
+        results.update(found)
+
+    for obj, field_name in pairs:
+        prefetched = obj.__dict__.setdefault(PREFETCHED_ATTR, {})
+        prefetched[(language, field_name)] = make_field_translation(obj, field_name,
+                results[(obj, field_name)], language)
+
+class TranslationBatch(object):
+    """
+    Collects the translations asked by the tag 'trans_field' inside a block
+    'translation_batch'. Each one is rendered as a placeholder token and all of
+    them are found together (see 'prefetch_translation_pairs') when the tokens are
+    replaced, at the end of the block.
+    """
+
+    def __init__(self):
+        self.prefix = '[[DJTF%08X-'%random.getrandbits(32)
+        self.pattern = re.compile(re.escape(self.prefix) + r'\d+\]\]')
+        self.pending = []
+        self.values = {}
+        self.count = 0
+
+    def defer(self, obj, field_name, formatter=None):
+        """Returns a token to be replaced by the translation of the field, passed
+        through the function 'formatter' if informed"""
+        token = '%s%d]]'%(self.prefix, self.count)
+        self.count += 1
+
+        self.pending.append((token, obj, field_name, format_language(get_language()), formatter))
+
+        return token
+
+    def resolve(self):
+        # Only the pairs (object, field) deferred are found, grouped by language
+        languages = {}
+        for token, obj, field_name, language, formatter in self.pending:
+            pairs, seen = languages.setdefault(language, ([], set()))
+            if (id(obj), field_name) not in seen:
+                seen.add((id(obj), field_name))
+                pairs.append((obj, field_name))
+
+        for language, (pairs, seen) in languages.items():
+            prefetch_translation_pairs(pairs, language)
+
+        for token, obj, field_name, language, formatter in self.pending:
+            value = get_prefetched(obj, field_name, language) or ''
+            if formatter:
+                value = formatter(value)
+
+            self.values[token] = unicode(value)
+
+        self.pending = []
+
+    def replace(self, content, charset=None):
+        """Returns the content with all tokens replaced by their translations"""
+        if self.pending:
+            self.resolve()
+
+        if not self.values or self.prefix not in content:
+            return content
+
+        if isinstance(content, unicode):
+            values = self.values
+        else:
+            charset = charset or settings.DEFAULT_CHARSET
+            values = dict([(token, value.encode(charset)) for token, value in self.values.items()])
+
+        return self.pattern.sub(lambda m: values.get(m.group(0), m.group(0)), content)
+
+def start_translation_batch():
+    """Starts collecting the translations of this thread in a new batch"""
+    _batches.current = TranslationBatch()
+    return _batches.current
 
-    # Stores in cache
-    TranslatedField.objects.save_to_cache(obj, field_name, result)
+def get_translation_batch():
+    return getattr(_batches, 'current', None)
 
-    return result
+def end_translation_batch(previous=None):
+    """Ends the current batch, making the informed one (of an outer block) the
+    current again"""
+    _batches.current = previous
 
@@ -0,0 +1,233 @@
+"""
+Import and export of translated fields (model TranslatedField) to CSV and PO
+files, for exchange with translators.
+
+Rows are read and written as a stream, in blocks, so big files don't need to
+fit in memory. Imports are saved by TranslatedFieldManager.set_translations,
+in batches, with their cache keys invalidated together.
+
+A row is a tuple (model, object id, field name, language, value), where model
+is a string "app_label.model".
+"""
+
+import csv
+
+from django.contrib.contenttypes.models import ContentType
+
+from djangoplus.models import TranslatedField, format_language
+
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+CSV_HEADER = ('model', 'object_id', 'field_name', 'language', 'value')
+
+def get_model_key(content_type):
+    return '%s.%s'%(content_type.app_label, content_type.model)
+
+_content_types = {}
+
+def get_content_type(model_key):
+    try:
+        return _content_types[model_key]
+    except KeyError:
+        app_label, model = model_key.lower().split('.', 1)
+        _content_types[model_key] = ContentType.objects.get(app_label=app_label, model=model)
+        return _content_types[model_key]
+
+# Export
+
+def iter_translation_rows(languages=None, models=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the rows of existing translations, optionally only for some
+    languages and models ("app_label.model"), reading EXPORT_CHUNK_SIZE at
+    once ordered by primary key"""
+    qs = TranslatedField.objects.order_by('pk')
+
+    if languages:
+        qs = qs.filter(language__in=[format_language(lang) for lang in languages])
+
+    if models:
+        qs = qs.filter(content_type__in=[get_content_type(m) for m in models])
+
+    last_pk = None
+    while True:
+        chunk_qs = qs
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+
+        chunk = list(chunk_qs.values_list('pk', 'content_type', 'object_id', 'field_name',
+            'language', 'value')[:chunk_size])
+
+        for pk, content_type_id, object_id, field_name, language, value in chunk:
+            yield (get_model_key(ContentType.objects.get_for_id(content_type_id)),
+                    object_id, field_name, language, value)
+
+        if len(chunk) < chunk_size:
+            break
+
+        last_pk = chunk[-1][0]
+
+def iter_with_originals(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the rows with the original field value appended, loading the
+    objects of each block of rows together"""
+    block = []
+
+    for row in rows:
+        block.append(row)
+
+        if len(block) >= chunk_size:
+            for item in add_originals(block):
+                yield item
+            block = []
+
+    for item in add_originals(block):
+        yield item
+
+def add_originals(rows):
+    object_ids = {}
+    for row in rows:
+        object_ids.setdefault(row[0], set()).add(row[1])
+
+    objects = {}
+    for model_key, ids in object_ids.items():
+        model = get_content_type(model_key).model_class()
+        for pk, obj in model._default_manager.in_bulk(list(ids)).items():
+            objects[(model_key, unicode(pk))] = obj
+
+    ret = []
+    for row in rows:
+        obj = objects.get((row[0], unicode(row[1])), None)
+        original = obj is not None and getattr(obj, row[2], None) or ''
+        ret.append(tuple(row) + (unicode(original),))
+
+    return ret
+
+def export_csv(out, rows):
+    """Writes the rows to a CSV file, encoded as UTF-8"""
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+
+    for row in rows:
+        writer.writerow([unicode(value or '').encode('utf-8') for value in row])
+
+def po_quote(value):
+    return '"%s"'%(value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n').replace('\t', '\\t'))
+
+def export_po(out, rows, language):
+    """Writes the rows of a language to a PO file, with the original field
+    values as msgid and the translations as msgstr. The object of each entry is
+    identified by its msgctxt "app_label.model:object id:field name"."""
+    out.write('msgid ""\nmsgstr ""\n')
+    out.write('"Language: %s\\n"\n'%format_language(language))
+    out.write('"Content-Type: text/plain; charset=UTF-8\\n"\n')
+
+    for model_key, object_id, field_name, row_language, value, original in iter_with_originals(rows):
+        context = '%s:%s:%s'%(model_key, object_id, field_name)
+
+        out.write('\n#: %s\n'%context.encode('utf-8'))
+        out.write('msgctxt %s\n'%po_quote(context).encode('utf-8'))
+        out.write('msgid %s\n'%po_quote(original).encode('utf-8'))
+        out.write('msgstr %s\n'%po_quote(value or u'').encode('utf-8'))
+
+# Import
+
+def iter_csv_rows(f):
+    """Yields the rows from a CSV file made by 'export_csv'"""
+    reader = csv.reader(f)
+
+    for i, row in enumerate(reader):
+        if i == 0 and tuple(row) == CSV_HEADER:
+            continue
+
+        if not row:
+            continue
+
+        yield tuple([value.decode('utf-8') for value in row[:5]])
+
+def po_unquote(value):
+    value = value.strip()[1:-1]
+    ret, i = [], 0
+
+    while i < len(value):
+        c = value[i]
+        if c == '\\' and i + 1 < len(value):
+            i += 1
+            c = {'n': '\n', 't': '\t'}.get(value[i], value[i])
+        ret.append(c)
+        i += 1
+
+    return ''.join(ret)
+
+def iter_po_entries(f):
+    """Yields dictionaries with the keys of each PO entry (msgctxt, msgid,
+    msgstr), joining continuation lines"""
+    entry, key = {}, None
+
+    for line in f:
+        line = line.decode('utf-8').strip()
+
+        if not line:
+            if entry:
+                yield entry
+            entry, key = {}, None
+        elif line.startswith('#'):
+            continue
+        elif line.startswith('"'):
+            if key:
+                entry[key] += po_unquote(line)
+        else:
+            key, value = line.split(None, 1)
+            if key in entry: # A new entry with no blank line between them
+                yield entry
+                entry = {}
+            entry[key] = po_unquote(value)
+
+    if entry:
+        yield entry
+
+def iter_po_rows(f, language=None):
+    """Yields the rows from a PO file made by 'export_po'. The language is
+    taken from the header if not informed. Entries with no translation are
+    ignored."""
+    for entry in iter_po_entries(f):
+        if not entry.get('msgid') and not entry.get('msgctxt'):
+            # Header
+            for line in entry.get('msgstr', '').split('\n'):
+                if line.startswith('Language:') and not language:
+                    language = line.split(':', 1)[1].strip()
+            continue
+
+        if not entry.get('msgstr') or not entry.get('msgctxt'):
+            continue
+
+        if not language:
+            raise ValueError('The language must be informed for PO files with no "Language" header')
+
+        model_key, rest = entry['msgctxt'].split(':', 1)
+        object_id, field_name = rest.rsplit(':', 1)
+        yield model_key, object_id, field_name, language, entry['msgstr']
+
+def import_rows(rows, batch_size=IMPORT_BATCH_SIZE):
+    """Saves the rows in batches with TranslatedFieldManager.set_translations.
+    Returns a tuple (created count, updated count)."""
+    created = updated = 0
+    batch = {}
+
+    for model_key, object_id, field_name, language, value in rows:
+        batch[(get_content_type(model_key), object_id, field_name, language)] = value
+
+        if len(batch) >= batch_size:
+            c, u = TranslatedField.objects.set_translations(batch)
+            created, updated, batch = created + c, updated + u, {}
+
+    if batch:
+        c, u = TranslatedField.objects.set_translations(batch)
+        created, updated = created + c, updated + u
+
+    return created, updated
+
+def import_csv(f, batch_size=IMPORT_BATCH_SIZE):
+    return import_rows(iter_csv_rows(f), batch_size)
+
+def import_po(f, language=None, batch_size=IMPORT_BATCH_SIZE):
+    return import_rows(iter_po_rows(f, language), batch_size)
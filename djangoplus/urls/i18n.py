@@ -2,5 +2,6 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns('djangoplus.views.i18n',
     url(r'^set-field-trans/$', 'set_field_translation', name='i18n_set_field_translation'),
+    url(r'^bulk-field-trans/$', 'bulk_field_translations', name='i18n_bulk_field_translations'),
 )
 
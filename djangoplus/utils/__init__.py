@@ -1,5 +1,19 @@
-def path_to_object(path):
-    """Returns a Python object from a string path"""
+import threading
+
+_resolved_paths = {}
+_resolved_paths_lock = threading.Lock()
+
+def path_to_object(path, cache=True):
+    """Returns a Python object from a string path.
+
+    Resolved paths are kept in a process-wide cache, so the import and getattr
+    are made only once for each path. Use 'clear_path_cache' to forget them."""
+    if cache:
+        try:
+            return _resolved_paths[path]
+        except KeyError:
+            pass
+
     dot = '.' in path and path.rindex('.') or None
     
     if dot:
@@ -10,8 +24,108 @@ def path_to_object(path):
     else:
         obj = __import__(path, {}, {}, [''])
 
+    if cache:
+        _resolved_paths_lock.acquire()
+        try:
+            _resolved_paths[path] = obj
+        finally:
+            _resolved_paths_lock.release()
+
     return obj
 
+def clear_path_cache(path=None):
+    """Removes a path from the cache of 'path_to_object', or all of them if no
+    path is informed. Useful after reloading a module."""
+    _resolved_paths_lock.acquire()
+    try:
+        if path is None:
+            _resolved_paths.clear()
+        else:
+            _resolved_paths.pop(path, None)
+    finally:
+        _resolved_paths_lock.release()
+
+# JUST COPIED FROM GERALDO REPORTS
+
+class AttrPathError(Exception):
+    pass
+
+_attr_paths = {}
+_attr_path_steps = {}
+
+def compile_attr_path(attr_path):
+    """Returns a tuple with the names in a dotted attribute path. Compiled
+    paths are cached, so the path string is split only once."""
+    try:
+        return _attr_paths[attr_path]
+    except KeyError:
+        pass
+
+    if not attr_path:
+        raise AttrPathError('Invalid attribute path \'%s\''%attr_path)
+
+    names = tuple(attr_path.split('.'))
+    _attr_paths[attr_path] = names
+
+    return names
+
+def get_attr_value(obj, attr_path):
+    """This function gets an attribute value from an object. If the attribute
+    is a method with no arguments (or arguments with default values) it calls
+    the method. If the expression string has a path to a child attribute, it
+    supports.
+    
+    Examples:
+        
+        attribute_name = 'name'
+        attribute_name = 'name.upper'
+        attribute_name = 'customer.name.lower'
+
+    The first time a path is used for an object class, the steps found (an
+    attribute or a key, for each name) are cached, and next calls just walk
+    them in a loop."""
+    names = compile_attr_path(attr_path)
+    steps_key = (obj.__class__, attr_path)
+
+    try:
+        steps = _attr_path_steps[steps_key]
+    except KeyError:
+        steps = None
+
+    val = None
+    if steps is not None:
+        try:
+            val = obj
+            for name, is_key in steps:
+                if is_key:
+                    val = val[name]
+                else:
+                    val = getattr(val, name)
+        except (AttributeError, KeyError, TypeError):
+            steps = None # Objects of this class don't have always the same steps
+
+    if steps is None:
+        val, steps = obj, []
+
+        for name in names:
+            try:
+                val = getattr(val, name)
+                steps.append((name, False))
+            except AttributeError:
+                try:
+                    val = val[name]
+                    steps.append((name, True))
+                except (KeyError, TypeError):
+                    raise AttrPathError('There is no attribute nor key "%s" in the object of class "%s"'%(
+                        name, val.__class__.__name__))
+
+        _attr_path_steps[steps_key] = tuple(steps)
+
+    if callable(val):
+        val = val()
+        
+    return val
+
 def split1000(s, sep=','):
     """http://www.python.org.br/wiki/FormatarNumeros"""
     minus = s.startswith('-')
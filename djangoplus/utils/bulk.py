@@ -0,0 +1,58 @@
+from django.db import connections, router, transaction
+
+BATCH_SIZE = 500
+
+def bulk_update(model, updates, using=None, batch_size=BATCH_SIZE):
+    """Updates many objects of a model class with an UPDATE ... CASE query for
+    each 'batch_size' objects, even when each one has different values.
+
+    'updates' is a list of tuples (primary key, {field name: value}). Fields
+    not informed for an object keep their values. Model save() methods and
+    signals are not called."""
+    if not updates:
+        return
+
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    pk_column = qn(opts.pk.column)
+
+    # PostgreSQL doesn't infer the type of parameters in CASE expressions
+    typed = getattr(connection, 'vendor', '') == 'postgresql'
+
+    cursor = connection.cursor()
+
+    for i in range(0, len(updates), batch_size):
+        batch = updates[i:i+batch_size]
+        field_names = []
+        for pk, values in batch:
+            field_names.extend([f for f in values.keys() if f not in field_names])
+
+        sets, params = [], []
+
+        for field_name in field_names:
+            field = opts.get_field(field_name)
+            column = qn(field.column)
+            value_sql = typed and 'CAST(%%s AS %s)'%field.db_type(connection=connection) or '%s'
+            whens = []
+
+            for pk, values in batch:
+                if field_name in values:
+                    whens.append('WHEN %%s THEN %s'%value_sql)
+                    params.extend([pk, field.get_db_prep_save(values[field_name], connection=connection)])
+
+            sets.append('%s = CASE %s %s ELSE %s END'%(column, pk_column, ' '.join(whens), column))
+
+        params.extend([pk for pk, values in batch])
+
+        cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)'%(
+            qn(opts.db_table),
+            ', '.join(sets),
+            pk_column,
+            ', '.join(['%s'] * len(batch)),
+            ), params)
+
+    # Django < 1.6 commits only connections marked as dirty
+    if hasattr(transaction, 'commit_unless_managed'):
+        transaction.commit_unless_managed(using=using)
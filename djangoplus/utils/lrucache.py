@@ -0,0 +1,95 @@
+import threading, time
+
+PREV, NEXT, KEY, VALUE, EXPIRES = 0, 1, 2, 3, 4
+
+class LRUCache(object):
+    """A thread-safe dictionary-like cache with a maximum size. When it is full,
+    the least recently used item is discarded to store a new one. If a timeout
+    (in seconds) is informed, items expire after it."""
+
+    max_size = 1000
+    timeout = None
+
+    def __init__(self, max_size=None, timeout=None):
+        self.max_size = max_size or self.max_size
+        self.timeout = timeout or self.timeout
+        self._lock = threading.Lock()
+        self._links = {}
+        self._root = root = []
+        root[:] = [root, root, None, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _link_last(self, link):
+        root = self._root
+        last = root[PREV]
+        link[PREV], link[NEXT] = last, root
+        last[NEXT] = root[PREV] = link
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.get(key, None)
+            if link is None:
+                return default
+
+            if link[EXPIRES] is not None and link[EXPIRES] <= time.time():
+                self._unlink(link)
+                del self._links[key]
+                return default
+
+            self._unlink(link)
+            self._link_last(link)
+
+            return link[VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        expires = self.timeout and time.time() + self.timeout or None
+
+        self._lock.acquire()
+        try:
+            link = self._links.get(key, None)
+
+            if link is not None:
+                link[VALUE], link[EXPIRES] = value, expires
+                self._unlink(link)
+            else:
+                if len(self._links) >= self.max_size:
+                    oldest = self._root[NEXT]
+                    self._unlink(oldest)
+                    del self._links[oldest[KEY]]
+
+                link = [None, None, key, value, expires]
+                self._links[key] = link
+
+            self._link_last(link)
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            root = self._root
+            root[:] = [root, root, None, None, None]
+        finally:
+            self._lock.release()
@@ -0,0 +1,129 @@
+"""Locale-aware number formatting with no calls to locale.setlocale while
+formatting.
+
+The separators and grouping of a locale are read only once (under a lock, as
+setlocale is process-global) and kept in a NumberFormat object, which is
+read-only after created and so safe to share between threads."""
+
+import locale, threading
+
+class NumberFormat(object):
+    decimal_point = '.'
+    thousands_sep = ''
+    grouping = (3, 0)
+
+    def __init__(self, decimal_point='.', thousands_sep='', grouping=(3, 0)):
+        self.decimal_point = decimal_point
+        self.thousands_sep = thousands_sep
+        self.grouping = tuple(grouping)
+
+        # The usual grouping (every 3 digits) is made by slicing
+        self.groups_of_3 = self.grouping in ((3, 0), (3, 3, 0))
+
+    def group(self, digits):
+        """Returns a string of digits with the thousands separators. Grouping
+        follows locale.localeconv(): the last item is 0 to repeat the previous
+        size or CHAR_MAX to stop grouping."""
+        if not self.thousands_sep:
+            return digits
+
+        if self.groups_of_3:
+            if len(digits) <= 3:
+                return digits
+
+            first = len(digits) % 3 or 3
+            return self.thousands_sep.join([digits[:first]] +
+                    [digits[i:i+3] for i in range(first, len(digits), 3)])
+
+        groups = []
+        size = None
+
+        for item in self.grouping:
+            if item == locale.CHAR_MAX:
+                break
+            elif item != 0:
+                size = item
+
+            if not digits or size is None:
+                break
+
+            groups.append(digits[-size:])
+            digits = digits[:-size]
+
+            if item == 0:
+                while digits:
+                    groups.append(digits[-size:])
+                    digits = digits[:-size]
+                break
+
+        if digits:
+            groups.append(digits)
+
+        groups.reverse()
+        return self.thousands_sep.join(groups)
+
+    def format(self, value, decimal_places=2):
+        """Returns the value formatted with the given number of decimal places"""
+        text = '%.*f'%(decimal_places, float(value or 0))
+
+        sign = ''
+        if text.startswith('-'):
+            sign, text = '-', text[1:]
+
+        if '.' in text:
+            int_part, dec_part = text.split('.', 1)
+            return sign + self.group(int_part) + self.decimal_point + dec_part
+
+        return sign + self.group(text)
+
+    def format_many(self, values, decimal_places=2):
+        """Returns a list with all values formatted, useful to format a whole
+        column at once"""
+        format = self.format
+        return [format(value, decimal_places) for value in values]
+
+_number_formats = {}
+_number_formats_lock = threading.Lock()
+
+def read_locale_format(locale_name=None):
+    """Returns a NumberFormat with the numeric conventions of a locale, or of
+    the current one if no name is informed. The previous locale is restored."""
+    if not locale_name:
+        conv = locale.localeconv()
+    else:
+        previous = locale.setlocale(locale.LC_NUMERIC)
+        try:
+            locale.setlocale(locale.LC_NUMERIC, locale_name)
+            conv = locale.localeconv()
+        finally:
+            locale.setlocale(locale.LC_NUMERIC, previous)
+
+    return NumberFormat(conv['decimal_point'], conv['thousands_sep'], conv['grouping'])
+
+def get_number_format(locale_name=None, thousands_separator=None):
+    """Returns a cached NumberFormat for a locale. If a thousands separator is
+    informed it is used instead of the locale's one, and the decimal point is
+    '.' when it is ',' or ',' otherwise."""
+    key = (locale_name, thousands_separator)
+
+    try:
+        return _number_formats[key]
+    except KeyError:
+        pass
+
+    _number_formats_lock.acquire()
+    try:
+        if key not in _number_formats:
+            if thousands_separator:
+                number_format = NumberFormat(
+                        thousands_separator == ',' and '.' or ',',
+                        thousands_separator,
+                        )
+            else:
+                number_format = read_locale_format(locale_name)
+
+            _number_formats[key] = number_format
+    finally:
+        _number_formats_lock.release()
+
+    return _number_formats[key]
@@ -6,6 +6,8 @@ from django.utils.translation import get_language
 from django.forms.models import modelformset_factory
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import simplejson
 
 from djangoplus.models import TranslatedField, format_language
 
@@ -21,13 +23,11 @@ def set_field_translation(request):
     original = c_type.get_object_for_this_type(pk=request.GET['object_id'])
     original_value = getattr(original, request.GET['field_name'])
 
-    # Creates objects for translation for available languages
-    for lang, display in settings.LANGUAGES:
-        TranslatedField.objects.get_or_create(
-            language=format_language(lang),
-            content_type=c_type,
-            object_id=request.GET['object_id'],
-            field_name=request.GET['field_name'],
+    # Creates together the objects for translation missing for available languages
+    TranslatedField.objects.create_missing_translations(
+            c_type,
+            [request.GET['object_id']],
+            [request.GET['field_name']],
             )
 
     # Gets queryset with translations
@@ -49,7 +49,11 @@ def set_field_translation(request):
         formset = FormSet(request.POST, queryset=translations)
 
         if formset.is_valid():
-            formset.save()
+            TranslatedField.objects.set_translations(dict([(
+                (c_type, request.GET['object_id'], request.GET['field_name'], form.cleaned_data['language']),
+                form.cleaned_data['value'],
+                ) for form in formset.forms if form.cleaned_data]))
+
             return HttpResponse('<script type="text/javascript">window.close()</script>')
     else:
         formset = FormSet(queryset=translations)
@@ -60,3 +64,45 @@ def set_field_translation(request):
             context_instance=RequestContext(request),
             )
 
+@staff_member_required
+def bulk_field_translations(request):
+    """Reads or saves translations for many objects and fields at once.
+
+    GET arguments are 'content_type', 'object_ids' and 'field_names' (comma
+    separated) and optionally 'languages'. The response is a JSON object
+    {object id: {field name: {language: value}}}.
+
+    POST body is a JSON object {"content_type": id, "translations": [[object id,
+    field name, language, value], ...]} and the response has the counts of
+    created and updated translations."""
+
+    if request.method == 'POST':
+        try:
+            body = request.body
+        except AttributeError: # Django 1.4-
+            body = request.raw_post_data
+
+        data = simplejson.loads(body)
+        c_type = ContentType.objects.get_for_id(data['content_type'])
+
+        created, updated = TranslatedField.objects.set_translations(dict([
+            ((c_type, object_id, field_name, language), value)
+            for object_id, field_name, language, value in data['translations']]))
+
+        result = {'created': created, 'updated': updated}
+    else:
+        c_type = ContentType.objects.get_for_id(request.GET['content_type'])
+        languages = [l for l in request.GET.get('languages', '').split(',') if l]
+
+        translations = TranslatedField.objects.get_translations(
+                c_type,
+                [i for i in request.GET['object_ids'].split(',') if i],
+                [f for f in request.GET['field_names'].split(',') if f],
+                languages,
+                )
+
+        result = {}
+        for (object_id, field_name, language), trans in translations.items():
+            result.setdefault(object_id, {}).setdefault(field_name, {})[language] = trans.value
+
+    return HttpResponse(simplejson.dumps(result), content_type='application/json')
@@ -14,7 +14,7 @@ from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.core.exceptions import ObjectDoesNotExist
 
-from djangoplus.utils import path_to_object, get_admin_url
+from djangoplus.utils import path_to_object, get_admin_url, get_attr_value, AttrPathError
 from djangoplus import app_settings
 
 registered_models = {}
@@ -247,19 +247,20 @@ class AjaxFKDriver(object):
         except AttributeError:
             pass
 
-        # Getting from dictionary
+        # Getting from dictionary, so keys are not taken for dict methods
         if isinstance(obj, dict):
             value = obj.get(field_name, None)
 
-        # Getting by attribute
-        else:
-            value = getattr(obj, field_name, None)
+            if callable(value):
+                value = value()
 
-        # If the attribute is callable
-        if callable(value):
-            value = value()
+            return value
 
-        return value
+        # Getting by attribute, calling it if callable
+        try:
+            return get_attr_value(obj, field_name)
+        except AttrPathError:
+            return None
 
     def get_columns(self):
         return [self._get_field_display(f) for f in self.list_display]